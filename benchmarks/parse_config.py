@@ -0,0 +1,61 @@
+##############################################################################
+#
+# Copyright Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Time parsing of big synthetic configuration files.
+
+Usage: python benchmarks/parse_config.py [number-of-lines ...]
+
+The configurations have a long [versions] section and parts with long
+multi-line ``eggs`` options, like generated configurations tend to have.
+"""
+
+from __future__ import unicode_literals
+
+import io
+import sys
+import timeit
+
+import zc.buildout.configparser
+
+
+def synthetic_config(lines):
+    """Return the text of a configuration with about the given number of lines
+    """
+    out = ['[buildout]', 'parts =']
+    nparts = max(lines // 10000, 1)
+    out.extend('    part%d' % i for i in range(nparts))
+    out.append('[versions]')
+    nversions = lines // 2
+    out.extend('package%d = 1.%d' % (i, i) for i in range(nversions))
+    eggs = (lines - nversions) // nparts
+    for i in range(nparts):
+        out.append('[part%d]' % i)
+        out.append('recipe = zc.recipe.egg')
+        out.append('eggs =')
+        out.extend('    package%d' % j for j in range(eggs))
+    out.append('')
+    return '\n'.join(out)
+
+
+def main(args):
+    sizes = [int(arg) for arg in args] or [10000, 30000, 100000]
+    for size in sizes:
+        text = synthetic_config(size)
+        def parse():
+            zc.buildout.configparser.parse(io.StringIO(text), 'buildout.cfg')
+        best = min(timeit.repeat(parse, number=1, repeat=3))
+        print('%7d lines: %.3f seconds' % (text.count('\n'), best))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
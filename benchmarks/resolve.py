@@ -0,0 +1,165 @@
+##############################################################################
+#
+# Copyright Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Time resolving the dependencies of big synthetic sets of eggs.
+
+Usage: python benchmarks/resolve.py [number-of-distributions ...]
+
+Every distribution requires a few of the ones after it, so most
+requirements are met many times, like in big working sets.  Versions
+are pinned for half of the distributions.
+
+Each set is resolved with the current resolution loop, and with the
+previous one, which took requirements from the front of a list and
+constrained them and looked up the requirements of distributions every
+time they were met.
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+
+import pkg_resources
+import zc.buildout
+import zc.buildout.easy_install
+from zc.buildout.easy_install import logger, VersionConflict
+
+
+class PreviousInstaller(zc.buildout.easy_install.Installer):
+    """An installer with the previous resolution loop
+    """
+
+    def install(self, specs, working_set=None):
+
+        logger.debug('Installing %s.', repr(specs)[1:-1])
+        self._requirements_and_constraints.append(
+            "Base installation request: %s" % repr(specs)[1:-1])
+
+        for_buildout_run = bool(working_set)
+
+        requirements = [self._constrain(pkg_resources.Requirement.parse(spec))
+                        for spec in specs]
+
+        if working_set is None:
+            ws = pkg_resources.WorkingSet([])
+        else:
+            ws = working_set
+
+        for requirement in requirements:
+            for dist in self._get_dist(requirement, ws):
+                self._maybe_add_setuptools(ws, dist)
+
+        requirements.reverse() # Set up the stack.
+        processed = {}  # This is a set of processed requirements.
+        best = {}  # This is a mapping of package name -> dist.
+        env = pkg_resources.Environment(ws.entries)
+
+        while requirements:
+            # Process dependencies breadth-first.
+            current_requirement = requirements.pop(0)
+            req = self._constrain(current_requirement)
+            if req in processed:
+                # Ignore cyclic or redundant dependencies.
+                continue
+            dist = best.get(req.key)
+            if dist is None:
+                try:
+                    dist = env.best_match(req, ws)
+                except pkg_resources.VersionConflict as err:
+                    if not for_buildout_run:
+                        raise VersionConflict(err, ws)
+            if dist is None:
+                self._log_requirement(ws, req)
+                for dist in self._get_dist(req, ws):
+                    self._maybe_add_setuptools(ws, dist)
+            if dist not in req:
+                raise VersionConflict(
+                    pkg_resources.VersionConflict(dist, req), ws)
+
+            best[req.key] = dist
+
+            missing_requested = sorted(
+                set(req.extras) - set(dist.extras)
+            )
+            if missing_requested:
+                if not self._allow_unknown_extras:
+                    raise zc.buildout.UserError(
+                        "Couldn't find the required extra.")
+                extra_requirements = sorted(
+                    set(dist.extras) & set(req.extras)
+                )
+            else:
+                extra_requirements = dist.requires(req.extras)[::-1]
+
+            for extra_requirement in extra_requirements:
+                self._requirements_and_constraints.append(
+                    "Requirement of %s: %s" % (
+                        current_requirement, extra_requirement))
+            requirements.extend(extra_requirements)
+
+            processed[req] = True
+        return ws
+
+
+def synthetic_eggs(directory, distributions):
+    """Make eggs requiring each other in directory, and return the pins
+    """
+    rand = random.Random(distributions)
+    pyversion = '%d.%d' % sys.version_info[:2]
+    versions = {}
+    for i in range(distributions):
+        name = 'package%d' % i
+        egg_info = os.path.join(
+            directory, '%s-1.0-py%s.egg' % (name, pyversion), 'EGG-INFO')
+        os.makedirs(egg_info)
+        with open(os.path.join(egg_info, 'PKG-INFO'), 'w') as f:
+            f.write('Metadata-Version: 1.0\nName: %s\nVersion: 1.0\n' % name)
+        later = range(i + 1, distributions)
+        required = rand.sample(later, min(len(later), 5))
+        with open(os.path.join(egg_info, 'requires.txt'), 'w') as f:
+            f.write(''.join('package%d >=0.5\n' % j for j in required))
+        if i % 2:
+            versions[name] = '1.0'
+    return versions
+
+
+def main(args):
+    sizes = [int(arg) for arg in args] or [100, 400, 1000]
+    for size in sizes:
+        tmp = tempfile.mkdtemp()
+        try:
+            versions = synthetic_eggs(tmp, size)
+            def resolve():
+                return zc.buildout.easy_install.install(
+                    ['package0'], None, path=[tmp], newest=False,
+                    versions=versions)
+            current = min(timeit.repeat(resolve, number=1, repeat=3))
+            installer = zc.buildout.easy_install.Installer
+            zc.buildout.easy_install.Installer = PreviousInstaller
+            try:
+                previous = min(timeit.repeat(resolve, number=1, repeat=3))
+                previous_ws = sorted(str(dist) for dist in resolve())
+            finally:
+                zc.buildout.easy_install.Installer = installer
+            assert previous_ws == sorted(str(dist) for dist in resolve())
+            print('%5d distributions: %.3f seconds, previously %.3f seconds'
+                  % (size, current, previous))
+        finally:
+            shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,72 @@
+##############################################################################
+#
+# Copyright Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Time resolving many chained ${section:option} substitutions.
+
+Usage: python benchmarks/substitutions.py [number-of-substitutions ...]
+
+Every option of the configuration refers to the one before it, either in
+the same section or, every tenth option, in the section before.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+import zc.buildout.buildout
+
+
+def synthetic_config(substitutions):
+    """Return the text of a configuration with chained substitutions
+    """
+    out = ['[buildout]', 'parts =', '', '[s0000]', 'o0000 = start']
+    for i in range(1, substitutions + 1):
+        section = 's%04d' % (i // 10)
+        if i % 10 == 0:
+            out.extend(['', '[%s]' % section])
+            previous = 's%04d' % (i // 10 - 1)
+        else:
+            previous = ''
+        out.append('o%04d = ${%s:o%04d}' % (i, previous, i - 1))
+    out.append('')
+    return '\n'.join(out), section, 'o%04d' % substitutions
+
+
+def main(args):
+    sizes = [int(arg) for arg in args] or [1000, 5000]
+    here = os.getcwd()
+    tmp = tempfile.mkdtemp()
+    try:
+        os.chdir(tmp)
+        for size in sizes:
+            text, section, option = synthetic_config(size)
+            with open('buildout.cfg', 'w') as f:
+                f.write(text)
+            def resolve():
+                buildout = zc.buildout.buildout.Buildout(
+                    'buildout.cfg', [('buildout', 'log-level', 'WARNING')],
+                    user_defaults=False)
+                for i in range(size // 10 + 1):
+                    buildout['s%04d' % i]
+                return buildout[section][option]
+            best = min(timeit.repeat(resolve, number=1, repeat=3))
+            print('%6d substitutions: %.3f seconds' % (size, best))
+    finally:
+        os.chdir(here)
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -15,6 +15,7 @@
 """
 
 from zc.buildout.rmtree import rmtree
+from zc.buildout.replace import replace as _replace
 import zc.buildout.easy_install
 
 try:
@@ -27,12 +28,29 @@ try:
 except ImportError:
     from UserDict import DictMixin
 
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
 import zc.buildout.configparser
-import copy
+import zc.buildout.context
 import datetime
 import distutils.errors
 import glob
+import hashlib
 import itertools
+import json
 import logging
 import os
 import pkg_resources
@@ -41,15 +59,23 @@ import shutil
 import subprocess
 import sys
 import tempfile
+import threading
 import zc.buildout
 import zc.buildout.download
+import zc.buildout.installed
 
 PY3 = sys.version_info[0] == 3
 if PY3:
     text_type = str
+
+    def _reraise(exc_info):
+        raise exc_info[1].with_traceback(exc_info[2])
 else:
     text_type = unicode
 
+    exec("def _reraise(exc_info):\n"
+         "    raise exc_info[0], exc_info[1], exc_info[2]\n")
+
 
 def command(method):
     method.buildout_command = True
@@ -88,25 +114,40 @@ class MissingSection(zc.buildout.UserError, KeyError):
         return "The referenced section, %r, was not defined." % self.args[0]
 
 
-def _annotate_section(section, source):
+def _annotate_section(section, source, record_history=True):
     for key in section:
-        section[key] = SectionKey(section[key], source)
+        section[key] = SectionKey(section[key], source, record_history)
     return section
 
 
+def _copy_section(section):
+    return dict((key, sectionkey.copy())
+                for (key, sectionkey) in section.items())
+
+
 class SectionKey(object):
-    def __init__(self, value, source):
-        self.history = []
+
+    __slots__ = ('value', 'operation', 'source', 'history')
+
+    # The history of a value is only needed to annotate it. Without it,
+    # only the last operation and its source are known.
+    def __init__(self, value, source, record_history=True):
+        self.history = [] if record_history else None
         self.value = value
         self.addToHistory("SET", value, source)
 
-    @property
-    def source(self):
-        return self.history[-1].source
+    def copy(self):
+        # History items are never changed, so the copy can share them.
+        result = self.__class__.__new__(self.__class__)
+        result.value = self.value
+        result.operation = self.operation
+        result.source = self.source
+        result.history = self.history and list(self.history)
+        return result
 
     def overrideValue(self, sectionkey):
         self.value = sectionkey.value
-        if sectionkey.history[-1].operation not in ['ADD', 'REMOVE']:
+        if sectionkey.operation not in ('ADD', 'REMOVE'):
             self.addToHistory("OVERRIDE", sectionkey.value, sectionkey.source)
 
     def setDirectory(self, value):
@@ -119,17 +160,25 @@ class SectionKey(object):
         self.addToHistory("ADD", added, source)
 
     def removeFromValue(self, removed, source):
+        removed_subvalues = set(removed.split('\n'))
         subvalues = [
             v
             for v in self.value.split('\n')
-            if v not in removed.split('\n')
+            if v not in removed_subvalues
         ]
         self.value = "\n".join(subvalues)
         self.addToHistory("REMOVE", removed, source)
 
     def addToHistory(self, operation, value, source):
-        item = HistoryItem(operation, value, source)
-        self.history.append(item)
+        self.operation = operation
+        self.source = source
+        if self.history is not None:
+            self.history.append(HistoryItem(operation, value, source))
+
+    def getHistory(self):
+        if self.history is None:
+            return [HistoryItem(self.operation, self.value, self.source)]
+        return self.history
 
     def printAll(self, key, basedir, verbose):
         self.printKeyAndValue(key)
@@ -153,13 +202,13 @@ class SectionKey(object):
 
     def printVerbose(self, basedir):
         print_()
-        for item in reversed(self.history):
+        for item in reversed(self.getHistory()):
             item.printAll(basedir)
         print_()
 
     def printTerse(self, basedir):
         toprint = []
-        history = copy.deepcopy(self.history)
+        history = list(self.getHistory())
         while history:
             next = history.pop()
             if next.operation in ["ADD", "REMOVE"]:
@@ -178,6 +227,9 @@ class SectionKey(object):
 
 
 class HistoryItem(object):
+
+    __slots__ = ('operation', 'value', 'source')
+
     def __init__(self, operation, value, source):
         self.operation = operation
         self.value = value
@@ -225,9 +277,9 @@ class HistoryItem(object):
             self.operation, " ".join(self.value.split('\n')), self.source)
 
 
-def _annotate(data, note):
+def _annotate(data, note, record_history=True):
     for key in data:
-        data[key] = _annotate_section(data[key], note)
+        data[key] = _annotate_section(data[key], note, record_history)
     return data
 
 
@@ -254,12 +306,67 @@ def _unannotate_section(section):
     return section
 
 
+def _section_values(section):
+    return dict((key, sectionkey.value)
+                for (key, sectionkey) in section.items())
+
+
 def _unannotate(data):
     for key in data:
         data[key] = _unannotate_section(data[key])
     return data
 
 
+class DependencyGraph(object):
+    """Dependencies between sections.
+
+    A section depends on the sections its options refer to in
+    substitutions and on its part dependencies (given with ``=>``).
+    Dependencies are recorded as sections are loaded, so the graph
+    covers the sections loaded so far.
+    """
+
+    def __init__(self):
+        self._dependencies = {}
+
+    def add(self, section, dependency=None):
+        """Add a section and, optionally, a section it depends on.
+        """
+        dependencies = self._dependencies.setdefault(section, [])
+        if dependency is None or dependency == section:
+            return
+        if dependency not in dependencies:
+            dependencies.append(dependency)
+        self._dependencies.setdefault(dependency, [])
+
+    def sections(self):
+        return sorted(self._dependencies)
+
+    def dependencies(self, section):
+        """Return the sections a section depends on, in the order found.
+        """
+        return list(self._dependencies.get(section, ()))
+
+    def dependents(self, section):
+        """Return the sections depending on a section.
+        """
+        return [name for name in self.sections()
+                if section in self._dependencies[name]]
+
+    def to_json(self):
+        return json.dumps(self._dependencies, indent=2, sort_keys=True)
+
+    def to_dot(self):
+        lines = ['digraph buildout {']
+        for section in self.sections():
+            lines.append('  %s;' % json.dumps(section))
+            for dependency in self._dependencies[section]:
+                lines.append('  %s -> %s;' % (json.dumps(section),
+                                              json.dumps(dependency)))
+        lines.append('}')
+        return '\n'.join(lines)
+
+
 def _format_picked_versions(picked_versions, required_by):
     output = ['[versions]']
     required_output = []
@@ -313,8 +420,12 @@ class Buildout(DictMixin):
 
         __doing__ = 'Initializing.'
 
+        # Recording the history of every option value is costly for big
+        # configurations, and it is only needed to annotate them.
+        record_history = command in (None, 'annotate')
+
         # default options
-        _buildout_default_options_copy = copy.deepcopy(
+        _buildout_default_options_copy = _copy_section(
             _buildout_default_options)
         data = dict(buildout=_buildout_default_options_copy)
         self._buildout_dir = os.getcwd()
@@ -347,7 +458,7 @@ class Buildout(DictMixin):
             for (section, v) in itertools.groupby(sorted(cloptions),
                                                   lambda v: v[0])
             )
-        override = copy.deepcopy(cloptions.get('buildout', {}))
+        override = _copy_section(cloptions.get('buildout', {}))
 
         # load user defaults, which override defaults
         if user_defaults:
@@ -358,16 +469,29 @@ class Buildout(DictMixin):
                     os.path.expanduser('~'), '.buildout')
             user_config = os.path.join(buildout_home, 'default.cfg')
             if os.path.exists(user_config):
-                data_buildout_copy = copy.deepcopy(data['buildout'])
+                data_buildout_copy = _copy_section(data['buildout'])
                 _update(data, _open(os.path.dirname(user_config), user_config,
                                     [], data_buildout_copy, override,
-                                    set()))
+                                    set(), record_history=record_history))
 
         # load configuration files
         if config_file:
-            data_buildout_copy = copy.deepcopy(data['buildout'])
-            _update(data, _open(os.path.dirname(config_file), config_file, [],
-                                data_buildout_copy, override, set()))
+            config_cache = _config_cache_directory(data['buildout'], override)
+            result = cache_key = None
+            if config_cache:
+                cache_key = _config_cache_key(
+                    config_file, data['buildout'], override, record_history)
+                result = _load_cached_config(config_cache, cache_key)
+            if result is None:
+                data_buildout_copy = _copy_section(data['buildout'])
+                downloaded = set()
+                result = _open(os.path.dirname(config_file), config_file, [],
+                               data_buildout_copy, override, downloaded,
+                               record_history=record_history)
+                if config_cache:
+                    _save_cached_config(
+                        config_cache, cache_key, downloaded, result)
+            _update(data, result)
 
         # apply command-line options
         _update(data, cloptions)
@@ -403,7 +527,8 @@ class Buildout(DictMixin):
         # and considering the location of the configuration file that generated
         # the setting as the base path, falling back to the main configuration
         # file location
-        for name in ('download-cache', 'eggs-directory', 'extends-cache'):
+        for name in ('config-cache', 'download-cache', 'eggs-directory',
+                     'extends-cache'):
             if name in data['buildout']:
                 sectionkey = data['buildout'][name]
                 origdir = sectionkey.value
@@ -432,10 +557,20 @@ class Buildout(DictMixin):
                     absdir = os.path.abspath(absdir)
                     sectionkey.setDirectory(absdir)
 
-        self._annotated = copy.deepcopy(data)
+        # The annotated values aren't changed anymore, so they can be
+        # shared with the unannotated copy-to-be.
+        self._annotated = dict((name, dict(section))
+                               for (name, section) in data.items())
         self._raw = _unannotate(data)
         self._data = {}
         self._parts = []
+        self._parsed_substitutions = {}
+        self.dependency_graph = DependencyGraph()
+        # Sections are initialized on first use, which may be in
+        # threads installing parts.  Recipes that change the working
+        # directory are run one at a time.
+        self._sections_lock = threading.RLock()
+        self._working_directory_lock = threading.Lock()
 
         # provide some defaults before options are parsed
         # because while parsing options those attributes might be
@@ -501,6 +636,22 @@ class Buildout(DictMixin):
             options['installed'] = os.path.join(options['directory'],
                                                 options['installed'])
 
+        installed_database = options.get('installed-database')
+        if installed_database:
+            installed_database = os.path.join(options['directory'],
+                                              installed_database)
+            options['installed-database'] = installed_database
+            self._installed_database = zc.buildout.installed.Database(
+                installed_database)
+        else:
+            self._installed_database = None
+        # The sections in the installed file, if known, whether changes
+        # were appended to it, and the changes not written yet.
+        self._installed_file_sections = None
+        self._installed_file_journaled = False
+        self._installed_journal = []
+        self._installed_journal_lock = threading.Lock()
+
         self._setup_logging()
         self._setup_socket_timeout()
 
@@ -529,6 +680,46 @@ class Buildout(DictMixin):
 
         download_cache = options.get('download-cache')
         extends_cache = options.get('extends-cache')
+        # These were used while reading the configuration; just mark
+        # them as used.
+        options.get('config-cache')
+        options.get('extends-jobs')
+
+        self.jobs = _jobs_option(options, 'jobs', '1')
+
+        if bool_option(options, 'background-uninstall', 'false'):
+            self._trash = _Trash(
+                os.path.join(options['directory'], '.buildout-trash'),
+                max(self.jobs, 4))
+        else:
+            self._trash = None
+
+        develop_hash_cache = options.get('develop-hash-cache')
+        if develop_hash_cache:
+            develop_hash_cache = os.path.join(options['directory'],
+                                              develop_hash_cache)
+            options['develop-hash-cache'] = develop_hash_cache
+            self._develop_hash_cache = _DirHashCache(develop_hash_cache)
+        else:
+            self._develop_hash_cache = None
+
+        develop_hash_algorithm = options.get('develop-hash-algorithm', 'md5')
+        try:
+            hashlib.new(develop_hash_algorithm)
+        except ValueError:
+            self._error("Invalid value for 'develop-hash-algorithm' option: %r",
+                        develop_hash_algorithm)
+        self._develop_hash_algorithm = develop_hash_algorithm
+        self._develop_hash_jobs = _cpu_count()
+
+        self.reuse_develop_eggs = bool_option(
+            options, 'reuse-develop-eggs', 'false')
+        self._develop_fingerprints = {}
+
+        self.verify_installed = options.get('verify-installed', 'exists')
+        if self.verify_installed not in ('exists', 'stat', 'content'):
+            self._error("Invalid value for 'verify-installed' option: %r",
+                        self.verify_installed)
 
         if bool_option(options, 'abi-tag-eggs', 'false'):
             from zc.buildout.pep425tags import get_abi_tag
@@ -560,6 +751,9 @@ class Buildout(DictMixin):
                     )
             zc.buildout.easy_install.install_from_cache(True)
 
+        zc.buildout.easy_install.eggs_directory_index(
+            bool_option(options, 'eggs-directory-index', 'false'))
+
         # "Use" each of the defaults so they aren't reported as unused options.
         for name in _buildout_default_options:
             options[name]
@@ -653,6 +847,18 @@ class Buildout(DictMixin):
 
     @command
     def install(self, install_args):
+        try:
+            self._install_parts(install_args)
+        finally:
+            self._flush_installed()
+            # Directories may have been put in the trash before a
+            # failure too.  Buildout can't exit before they're removed.
+            if self._trash is not None:
+                self._trash.join()
+        if self._trash is not None:
+            self._trash.check()
+
+    def _install_parts(self, install_args):
         __doing__ = 'Installing.'
 
         self._load_extensions()
@@ -669,20 +875,36 @@ class Buildout(DictMixin):
         (installed_part_options, installed_exists
          )= self._read_installed_part_options()
 
-        # Remove old develop eggs
-        self._uninstall(
-            installed_part_options['buildout'].get(
-                'installed_develop_eggs', '')
-            )
+        # Remove old develop eggs, except those that can be reused
+        old_develop_eggs = installed_part_options['buildout'].get(
+            'installed_develop_eggs', '')
+        if self.reuse_develop_eggs:
+            reusable = self._reusable_develop_eggs(
+                old_develop_eggs.split('\n'),
+                installed_part_options['buildout'].get(
+                    'installed_develop_fingerprints', ''))
+        else:
+            reusable = {}
+        reused = set(reusable.values())
+        self._uninstall('\n'.join(
+            egg for egg in old_develop_eggs.split('\n') if egg not in reused))
 
         # Build develop eggs
-        installed_develop_eggs = self._develop()
+        installed_develop_eggs = self._develop(reusable)
+        self._uninstall('\n'.join(
+            egg for egg in reusable.values()
+            if egg not in installed_develop_eggs.split('\n')))
         installed_part_options['buildout']['installed_develop_eggs'
                                            ] = installed_develop_eggs
+        develop_options = dict(installed_develop_eggs=installed_develop_eggs)
+        if self.reuse_develop_eggs:
+            develop_options['installed_develop_fingerprints'] = json.dumps(
+                self._develop_fingerprints, sort_keys=True)
+            installed_part_options['buildout'].update(develop_options)
 
         if installed_exists:
-            self._update_installed(
-                installed_develop_eggs=installed_develop_eggs)
+            self._update_installed(**develop_options)
+            self._flush_installed()
 
         # get configured and installed part lists
         conf_parts = self['buildout']['parts']
@@ -719,23 +941,32 @@ class Buildout(DictMixin):
         # have changed
         for part in reversed(installed_parts):
             if part in install_parts:
-                old_options = installed_part_options[part].copy()
-                installed_files = old_options.pop('__buildout_installed__')
+                installed_options = installed_part_options[part]
                 new_options = self.get(part)
-                if old_options == new_options:
+                fingerprint = installed_options.get('__buildout_fingerprint__')
+                if fingerprint is not None:
+                    unchanged = fingerprint == _options_fingerprint(new_options)
+                else:
+                    # Installed by a buildout that didn't record
+                    # fingerprints.
+                    unchanged = (_configured_options(installed_options)
+                                 == new_options)
+                if unchanged:
                     # The options are the same, but are all of the
-                    # installed files still there?  If not, we should
-                    # reinstall.
+                    # installed files still there, and unchanged?  If
+                    # not, we should reinstall.
+                    installed_files = installed_options[
+                        '__buildout_installed__']
                     if not installed_files:
                         continue
-                    for f in installed_files.split('\n'):
-                        if not os.path.exists(self._buildout_path(f)):
-                            break
-                    else:
+                    if self._installed_files_unchanged(
+                            installed_files,
+                            installed_options.get('__buildout_manifest__')):
                         continue
 
                 # output debugging info
                 if self._logger.getEffectiveLevel() < logging.DEBUG:
+                    old_options = _configured_options(installed_options)
                     for k in old_options:
                         if k not in new_options:
                             self._logger.debug("Part %s, dropped option %s.",
@@ -757,110 +988,260 @@ class Buildout(DictMixin):
             installed_parts = [p for p in installed_parts if p != part]
 
             if installed_exists:
-                self._update_installed(parts=' '.join(installed_parts))
+                self._update_installed(
+                    uninstalled=part, parts=' '.join(installed_parts))
+        self._flush_installed()
 
         # Check for unused buildout options:
         _check_for_unused_options_in_section(self, 'buildout')
 
         # install new parts
-        for part in install_parts:
+        installation = _Installation(installed_part_options, installed_parts,
+                                     installed_exists, install_parts)
+        if self.jobs > 1 and len(install_parts) > 1:
+            self._install_parts_concurrently(install_parts, installation)
+        else:
+            for part in install_parts:
+                self._install_part(part, installation)
+        installed_parts = installation.parts
+        installed_exists = installation.exists
+
+        if installed_develop_eggs:
+            if not installed_exists:
+                self._save_installed_options(installed_part_options)
+        elif (not installed_parts) and installed_exists:
+            self._remove_installed()
+        if installed_exists:
+            installed_part_options['buildout']['parts'] = (
+                ' '.join(installed_parts))
+            self._compact_installed(installed_part_options)
+
+        if self.show_picked_versions or self.update_versions_file:
+            self._print_picked_versions()
+        self._unload_extensions()
+
+    def _install_part(self, part, installation):
+        # Install or update a part.  Everything but running the recipe
+        # is done holding the installation lock, so parts can be
+        # installed by several threads.
+        installed_part_options = installation.options
+        with installation.lock:
             signature = self[part].pop('__buildout_signature__')
             saved_options = self[part].copy()
             recipe = self[part].recipe
-            if part in installed_parts: # update
-                need_to_save_installed = False
+            updating = part in installation.parts
+            if updating:
                 __doing__ = 'Updating %s.', part
-                self._logger.info(*__doing__)
-                old_options = installed_part_options[part]
-                old_installed_files = old_options['__buildout_installed__']
+            else:
+                __doing__ = 'Installing %s.', part
+            self._logger.info(*__doing__)
 
-                try:
-                    update = recipe.update
-                except AttributeError:
-                    update = recipe.install
-                    self._logger.warning(
-                        "The recipe for %s doesn't define an update "
-                        "method. Using its install method.",
-                        part)
+        if updating:
+            need_to_save_installed = False
+            old_options = installed_part_options[part]
+            old_installed_files = old_options['__buildout_installed__']
 
-                try:
-                    installed_files = self[part]._call(update)
-                except:
-                    installed_parts.remove(part)
+            try:
+                update = recipe.update
+            except AttributeError:
+                update = recipe.install
+                self._logger.warning(
+                    "The recipe for %s doesn't define an update "
+                    "method. Using its install method.",
+                    part)
+
+            try:
+                installed_files = self[part]._call(update)
+            except:
+                with installation.lock:
+                    installation.parts.remove(part)
                     self._uninstall(old_installed_files)
-                    if installed_exists:
+                    if installation.exists:
                         self._update_installed(
-                            parts=' '.join(installed_parts))
-                    raise
+                            uninstalled=part,
+                            parts=' '.join(installation.parts))
+                raise
 
-                old_installed_files = old_installed_files.split('\n')
-                if installed_files is None:
-                    installed_files = old_installed_files
+            old_installed_files = old_installed_files.split('\n')
+            if installed_files is None:
+                installed_files = old_installed_files
+            else:
+                if isinstance(installed_files, str):
+                    installed_files = [installed_files]
                 else:
-                    if isinstance(installed_files, str):
-                        installed_files = [installed_files]
-                    else:
-                        installed_files = list(installed_files)
+                    installed_files = list(installed_files)
 
-                    need_to_save_installed = [
-                        p for p in installed_files
-                        if p not in old_installed_files]
+                need_to_save_installed = [
+                    p for p in installed_files
+                    if p not in old_installed_files]
 
-                    if need_to_save_installed:
-                        installed_files = (old_installed_files
-                                           + need_to_save_installed)
+                if need_to_save_installed:
+                    installed_files = (old_installed_files
+                                       + need_to_save_installed)
 
-            else: # install
+        else: # install
+            need_to_save_installed = True
+            installed_files = self[part]._call(recipe.install)
+            if installed_files is None:
+                self._logger.warning(
+                    "The %s install returned None.  A path or "
+                    "iterable os paths should be returned.",
+                    part)
+                installed_files = ()
+            elif isinstance(installed_files, str):
+                installed_files = [installed_files]
+            else:
+                installed_files = list(installed_files)
+
+        manifest = None
+        if self.verify_installed != 'exists':
+            manifest = self._installed_files_manifest(installed_files)
+            if updating and (
+                manifest != old_options.get('__buildout_manifest__')):
                 need_to_save_installed = True
-                __doing__ = 'Installing %s.', part
-                self._logger.info(*__doing__)
-                installed_files = self[part]._call(recipe.install)
-                if installed_files is None:
-                    self._logger.warning(
-                        "The %s install returned None.  A path or "
-                        "iterable os paths should be returned.",
-                        part)
-                    installed_files = ()
-                elif isinstance(installed_files, str):
-                    installed_files = [installed_files]
-                else:
-                    installed_files = list(installed_files)
 
+        with installation.lock:
             installed_part_options[part] = saved_options
             saved_options['__buildout_installed__'
                           ] = '\n'.join(installed_files)
             saved_options['__buildout_signature__'] = signature
+            if manifest is not None:
+                saved_options['__buildout_manifest__'] = manifest
+            saved_options['__buildout_fingerprint__'] = _options_fingerprint(
+                saved_options)
 
-            installed_parts = [p for p in installed_parts if p != part]
-            installed_parts.append(part)
+            installation.add(part)
             _check_for_unused_options_in_section(self, part)
 
             if need_to_save_installed:
                 installed_part_options['buildout']['parts'] = (
-                    ' '.join(installed_parts))
-                self._save_installed_options(installed_part_options)
-                installed_exists = True
+                    ' '.join(installation.parts))
+                self._save_installed_options(installed_part_options, part)
+                installation.exists = True
             else:
-                assert installed_exists
-                self._update_installed(parts=' '.join(installed_parts))
-
-        if installed_develop_eggs:
-            if not installed_exists:
-                self._save_installed_options(installed_part_options)
-        elif (not installed_parts) and installed_exists:
-            os.remove(self['buildout']['installed'])
-
-        if self.show_picked_versions or self.update_versions_file:
-            self._print_picked_versions()
-        self._unload_extensions()
+                assert installation.exists
+                self._update_installed(parts=' '.join(installation.parts))
+        self._flush_installed()
+
+    def _installed_files_unchanged(self, installed_files, manifest):
+        paths = [self._buildout_path(f) for f in installed_files.split('\n')]
+        if self.verify_installed == 'exists' or manifest is None:
+            recorded = [''] * len(paths)
+        else:
+            recorded = manifest.split('\n')
+        return zc.buildout.installed.all_unchanged(paths, recorded)
+
+    def _installed_files_manifest(self, installed_files):
+        # Record the state of installed files, to check them later.
+        content = self.verify_installed == 'content'
+        return '\n'.join([
+            zc.buildout.installed.fingerprint(
+                self._buildout_path(f), content) or ''
+            for f in installed_files])
+
+    def _install_parts_concurrently(self, install_parts, installation):
+        # Install up to self.jobs parts at a time.  A part is only
+        # installed once the parts before it that it depends on are.
+        waiting_for = self._part_dependencies(install_parts)
+        pending = list(install_parts)
+        done = set()
+        results = queue.Queue()
+        threads = []
+        running = 0
+        error = None
+
+        def install(part):
+            try:
+                self._install_part(part, installation)
+            except:
+                results.put((part, sys.exc_info()))
+            else:
+                results.put((part, None))
+
+        while pending or running:
+            if error is None:
+                for part in list(pending):
+                    if running >= self.jobs:
+                        break
+                    if waiting_for[part] <= done:
+                        pending.remove(part)
+                        thread = threading.Thread(target=install, args=(part,))
+                        thread.daemon = True
+                        thread.start()
+                        threads.append(thread)
+                        running += 1
+            if not running:
+                break
+            part, part_error = results.get()
+            running -= 1
+            if part_error is None:
+                done.add(part)
+            elif error is None:
+                # Let the parts being installed finish, but don't
+                # start new ones.
+                error = part_error
+
+        for thread in threads:
+            thread.join()
+        if error is not None:
+            _reraise(error)
+
+    def _part_dependencies(self, parts):
+        # Return the parts each part depends on, directly or through
+        # other sections, among the parts before it.
+        graph = self.dependency_graph
+        result = {}
+        before = set()
+        for part in parts:
+            seen = set([part])
+            todo = [part]
+            while todo:
+                for section in graph.dependencies(todo.pop()):
+                    if section not in seen:
+                        seen.add(section)
+                        todo.append(section)
+            result[part] = seen & before
+            before.add(part)
+        return result
 
-    def _update_installed(self, **buildout_options):
-        installed = self['buildout']['installed']
-        f = open(installed, 'a')
+    def _update_installed(self, uninstalled=None, **buildout_options):
+        # Record changed buildout options, after uninstalling a part, if
+        # one is given.
+        if self._installed_database is not None:
+            self._installed_database.update('buildout', **buildout_options)
+            if uninstalled is not None:
+                self._installed_database.delete([uninstalled])
+            return
+        f = StringIO()
         f.write('\n[buildout]\n')
         for option, value in list(buildout_options.items()):
             _save_option(option, value, f)
-        f.close()
+        self._append_installed(f.getvalue())
+
+    def _append_installed(self, text):
+        # Record changes in the installed file by appending them, so
+        # they're saved quickly and an interrupted buildout knows what
+        # was done.  The changes are written by _flush_installed, once
+        # per step of the installation, and the file is compacted when
+        # the buildout succeeds.
+        with self._installed_journal_lock:
+            self._installed_journal.append(text)
+            self._installed_file_journaled = True
+
+    def _flush_installed(self):
+        # Write the changes appended since the last flush, if any.
+        with self._installed_journal_lock:
+            if not self._installed_journal:
+                return
+            text = ''.join(self._installed_journal)
+            del self._installed_journal[:]
+            f = open(self['buildout']['installed'], 'a')
+            try:
+                f.write(text)
+                f.flush()
+                _fsync(f.fileno())
+            finally:
+                f.close()
 
     def _uninstall_part(self, part, installed_part_options):
         # uninstall part
@@ -891,14 +1272,21 @@ class Buildout(DictMixin):
                 self._logger.info('Creating directory %r.', d)
                 os.mkdir(d)
 
-    def _develop(self):
+    def _develop(self, reusable=None):
         """Install sources by running setup.py develop on them
+
+        Sources whose develop eggs can be reused, as found by
+        _reusable_develop_eggs, are skipped, and removed from reusable.
         """
         __doing__ = 'Processing directories listed in the develop option'
 
+        self._develop_fingerprints = {}
         develop = self['buildout'].get('develop')
         if not develop:
             return ''
+        if reusable is None:
+            reusable = {}
+        reused = []
 
         dest = self['buildout']['develop-eggs-directory']
         old_files = os.listdir(dest)
@@ -908,6 +1296,7 @@ class Buildout(DictMixin):
         here = os.getcwd()
         try:
             try:
+                setups = []
                 for setup in develop.split():
                     setup = self._buildout_path(setup)
                     files = glob.glob(setup)
@@ -917,9 +1306,28 @@ class Buildout(DictMixin):
                     else:
                         files.sort()
                     for setup in files:
-                        self._logger.info("Develop: %r", setup)
-                        __doing__ = 'Processing develop directory %r.', setup
-                        zc.buildout.easy_install.develop(setup, dest)
+                        egg_link = reusable.pop(setup, None)
+                        if egg_link is not None:
+                            self._logger.info("Develop: %r", setup)
+                            self._logger.debug(
+                                "Reusing %r, which is unchanged.", egg_link)
+                            reused.append(egg_link)
+                        setups.append((setup, egg_link))
+
+                developed = iter(self._develop_setups(
+                    [setup for (setup, egg_link) in setups
+                     if egg_link is None],
+                    dest))
+                egg_links = []
+                for setup, egg_link in setups:
+                    if egg_link is None:
+                        egg_link = next(developed)
+                    egg_links.append(egg_link)
+                    if self.reuse_develop_eggs:
+                        fingerprint = _develop_fingerprint(setup, egg_link)
+                        if fingerprint is not None:
+                            self._develop_fingerprints[setup] = [
+                                egg_link, fingerprint]
             except:
                 # if we had an error, we need to roll back changes, by
                 # removing any files we created.
@@ -933,15 +1341,113 @@ class Buildout(DictMixin):
 
             else:
                 self._sanity_check_develop_eggs_files(dest, old_files)
-                return '\n'.join([os.path.join(dest, f)
-                                  for f in os.listdir(dest)
-                                  if f not in old_files
-                                  ])
+                # Record the develop eggs in the order of the develop
+                # option, however they were made, followed by any other
+                # new files.
+                new = [os.path.join(dest, f)
+                       for f in os.listdir(dest)
+                       if f not in old_files
+                       ]
+                recorded = [egg_link for egg_link in egg_links
+                            if egg_link in new or egg_link in reused]
+                return '\n'.join(
+                    recorded + [f for f in new if f not in recorded])
 
         finally:
             os.chdir(here)
 
 
+    def _develop_setups(self, setups, dest):
+        # Run setup.py develop for each of the setups, up to self.jobs
+        # at a time, and return the egg links made, in the same order.
+        def develop(setup):
+            __doing__ = 'Processing develop directory %r.', setup
+            self._logger.info("Develop: %r", setup)
+            return zc.buildout.easy_install.develop(setup, dest)
+
+        jobs = min(self.jobs, len(setups))
+        if jobs <= 1:
+            return [develop(setup) for setup in setups]
+
+        pending = queue.Queue()
+        for index, setup in enumerate(setups):
+            pending.put((index, setup))
+        results = [None] * len(setups)
+        errors = []
+        # What's logged while developing a setup is held back, to be
+        # logged in the order of the setups, as if they were developed
+        # one at a time.
+        log_buffer = _LogBuffer()
+        logged = [None] * len(setups)
+        finished = queue.Queue()
+
+        def work():
+            try:
+                while not errors:
+                    try:
+                        index, setup = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    logged[index] = log_buffer.start()
+                    try:
+                        results[index] = develop(setup)
+                    except:
+                        # Let the setups being developed finish, but
+                        # don't start new ones.
+                        errors.append((index, sys.exc_info()))
+                    finally:
+                        log_buffer.stop()
+                        finished.put(index)
+            finally:
+                finished.put(None)
+
+        handlers = set(logging.getLogger().handlers + self._logger.handlers)
+        for handler in handlers:
+            handler.addFilter(log_buffer)
+        try:
+            threads = [threading.Thread(target=work) for i in range(jobs)]
+            for thread in threads:
+                thread.daemon = True
+                thread.start()
+            done = set()
+            next_index = 0
+            running = jobs
+            while running:
+                index = finished.get()
+                if index is None:
+                    running -= 1
+                    continue
+                done.add(index)
+                while next_index in done:
+                    log_buffer.emit(logged[next_index])
+                    next_index += 1
+            for index in sorted(done):
+                if index >= next_index:
+                    log_buffer.emit(logged[index])
+            for thread in threads:
+                thread.join()
+        finally:
+            for handler in handlers:
+                handler.removeFilter(log_buffer)
+        if errors:
+            _reraise(min(errors, key=lambda error: error[0])[1])
+        return results
+
+    def _reusable_develop_eggs(self, installed_develop_eggs, fingerprints):
+        # Return a dictionary of the develop egg links, by setup path,
+        # that were recorded with the sources they were made from and
+        # whose sources haven't changed since.
+        try:
+            fingerprints = json.loads(fingerprints or '{}')
+        except ValueError:
+            return {}
+        result = {}
+        for setup, (egg_link, fingerprint) in fingerprints.items():
+            if (egg_link in installed_develop_eggs and
+                _develop_fingerprint(setup, egg_link) == fingerprint):
+                result[setup] = egg_link
+        return result
+
     def _sanity_check_develop_eggs_files(self, dest, old_files):
         for f in os.listdir(dest):
             if f in old_files:
@@ -952,36 +1458,92 @@ class Buildout(DictMixin):
                     "Unexpected entry, %r, in develop-eggs directory.", f)
 
     def _compute_part_signatures(self, parts):
-        # Compute recipe signature and add to options
+        # Compute recipe signature and add to options.  Parts often
+        # share recipes, so each recipe's signature is computed once.
+        signatures = {}
         for part in parts:
             options = self.get(part)
             if options is None:
                 options = self[part] = {}
             recipe, entry = _recipe(options)
             req = pkg_resources.Requirement.parse(recipe)
-            sig = _dists_sig(pkg_resources.working_set.resolve([req]))
-            options['__buildout_signature__'] = ' '.join(sig)
+            sig = signatures.get(req)
+            if sig is None:
+                sig = signatures[req] = ' '.join(
+                    _dists_sig(pkg_resources.working_set.resolve([req]),
+                               self._develop_dir_hash))
+            options['__buildout_signature__'] = sig
+        if self._develop_hash_cache is not None:
+            self._develop_hash_cache.save()
+
+    def _develop_dir_hash(self, dir):
+        return _dir_hash(dir, self._develop_hash_algorithm,
+                         self._develop_hash_jobs, self._develop_hash_cache)
 
     def _read_installed_part_options(self):
+        sections = self._read_installed()
+        if sections is not None:
+            result = {}
+            for section, options in sections.items():
+                result[section] = self.Options(self, section, options)
+
+            return result, True
+        else:
+            return ({'buildout': self.Options(self, 'buildout', {'parts': ''})},
+                    False,
+                    )
+
+    def _read_installed(self, import_file=True):
+        # Return the options of the installed sections, or None if
+        # nothing is installed.
+        database = self._installed_database
+        if database is not None:
+            if database.exists():
+                sections = database.read()
+                # Like a missing installed file, a database without a
+                # buildout section means nothing is installed.
+                if 'buildout' not in sections:
+                    return None
+                return sections
+            # Start using the database: import the installed file.
+            sections = self._read_installed_file()
+            if sections is not None and import_file:
+                database.write(sections)
+                os.remove(self['buildout']['installed'])
+            return sections
+        return self._read_installed_file()
+
+    def _read_installed_file(self):
         old = self['buildout']['installed']
         if old and os.path.isfile(old):
             fp = open(old)
             sections = zc.buildout.configparser.parse(fp, old)
             fp.close()
-            result = {}
             for section, options in sections.items():
                 for option, value in options.items():
                     if '%(' in value:
                         for k, v in _spacey_defaults:
                             value = value.replace(k, v)
                         options[option] = value
-                result[section] = self.Options(self, section, options)
+            self._installed_file_sections = set(sections)
+            return sections
+        return None
 
-            return result, True
+    def _remove_installed(self):
+        if self._installed_database is not None:
+            self._installed_database.remove()
         else:
-            return ({'buildout': self.Options(self, 'buildout', {'parts': ''})},
-                    False,
-                    )
+            with self._installed_journal_lock:
+                del self._installed_journal[:]
+                os.remove(self['buildout']['installed'])
+            self._installed_file_sections = None
+            self._installed_file_journaled = False
+
+    def _compact_installed(self, installed_options):
+        # Replace the changes appended to the installed file by the
+        # state they lead to.
+        if self._installed_file_journaled:
+            self._save_installed_options(installed_options)
 
     def _uninstall(self, installed):
         for f in installed.split('\n'):
@@ -989,7 +1551,8 @@ class Buildout(DictMixin):
                 continue
             f = self._buildout_path(f)
             if os.path.isdir(f):
-                rmtree(f)
+                if self._trash is None or not self._trash.put(f):
+                    rmtree(f)
             elif os.path.isfile(f):
                 try:
                     os.remove(f)
@@ -1022,16 +1585,46 @@ class Buildout(DictMixin):
         return ' '.join(installed)
 
 
-    def _save_installed_options(self, installed_options):
+    def _save_installed_options(self, installed_options, part=None):
+        # Save the installed sections.  If a part is given, only it and
+        # the buildout section have changed.
+        if self._installed_database is not None:
+            if part is None:
+                parts = installed_options['buildout']['parts'].split()
+                self._installed_database.write(dict(
+                    [(name, installed_options[name])
+                     for name in ['buildout'] + parts]))
+            else:
+                self._installed_database.save({
+                    'buildout': installed_options['buildout'],
+                    part: installed_options[part],
+                    })
+            return
         installed = self['buildout']['installed']
         if not installed:
             return
-        f = open(installed, 'w')
-        _save_options('buildout', installed_options['buildout'], f)
-        for part in installed_options['buildout']['parts'].split():
+        sections = self._installed_file_sections
+        if part is not None and sections is not None and part not in sections:
+            # Appending the new part is enough, as long as there's no
+            # older section for it that it would be merged with.
+            f = StringIO()
             print_(file=f)
             _save_options(part, installed_options[part], f)
-        f.close()
+            print_(file=f)
+            print_('[buildout]', file=f)
+            _save_option('parts', installed_options['buildout']['parts'], f)
+            self._append_installed(f.getvalue())
+            sections.add(part)
+            return
+        f = StringIO()
+        _save_installed_sections(installed_options, f)
+        with self._installed_journal_lock:
+            # The changes not written yet are part of the new state.
+            del self._installed_journal[:]
+            _write_file(installed, f.getvalue())
+        self._installed_file_sections = set(
+            ['buildout'] + installed_options['buildout']['parts'].split())
+        self._installed_file_journaled = False
 
     def _error(self, message, *args):
         raise zc.buildout.UserError(message % args)
@@ -1292,6 +1885,53 @@ class Buildout(DictMixin):
             sections = args
         _print_annotate(self._annotated, verbose, sections, self._buildout_dir)
 
+    @command
+    def graph(self, args=None):
+        if args and (len(args) > 1 or args[0] not in ('dot', 'json')):
+            _error('The graph command takes dot or json as its only argument.')
+        __doing__ = 'Computing dependencies.'
+
+        # Load the parts, as for installing them, which records their
+        # dependencies.  Nothing is installed: as in offline mode,
+        # extensions and recipes are only looked for in the eggs and
+        # develop eggs there are already.
+        self.offline = True
+        self.newest = False
+        self._load_extensions()
+        sys.path.insert(0, self['buildout']['develop-eggs-directory'])
+        for part in self['buildout']['parts'].split():
+            try:
+                self[part]['recipe']
+            except zc.buildout.UserError:
+                options = self._data.get(part)
+                if options is None or not options.get('recipe'):
+                    raise
+                spec = _recipe(options)[0]
+                if pkg_resources.working_set.find(
+                        pkg_resources.Requirement.parse(spec)) is not None:
+                    raise
+                raise zc.buildout.UserError(
+                    "The %s recipe of the %s part isn't installed.\n"
+                    "Run buildout install to install it, or to make the"
+                    " develop egg it comes from."
+                    % (spec, part))
+
+        if args and args[0] == 'json':
+            print_(self.dependency_graph.to_json())
+        else:
+            print_(self.dependency_graph.to_dot())
+        self._unload_extensions()
+
+    @command
+    def installed(self, args=None):
+        if args:
+            _error('The installed command takes no arguments.')
+        __doing__ = 'Reading installed parts.'
+
+        sections = self._read_installed(import_file=False)
+        if sections is not None:
+            _save_installed_sections(sections, sys.stdout)
+
     def print_options(self, base_path=None):
         for section in sorted(self._data):
             if section == 'buildout' or section == self['buildout']['versions']:
@@ -1314,15 +1954,21 @@ class Buildout(DictMixin):
         except KeyError:
             pass
 
-        try:
-            data = self._raw[section]
-        except KeyError:
-            raise MissingSection(section)
+        with self._sections_lock:
+            try:
+                return self._data[section]
+            except KeyError:
+                pass
 
-        options = self.Options(self, section, data)
-        self._data[section] = options
-        options._initialize()
-        return options
+            try:
+                data = self._raw[section]
+            except KeyError:
+                raise MissingSection(section)
+
+            options = self.Options(self, section, data)
+            self._data[section] = options
+            options._initialize()
+            return options
 
     def __setitem__(self, name, data):
         if name in self._raw:
@@ -1331,10 +1977,6 @@ class Buildout(DictMixin):
         self[name] # Add to parts
 
     def parse(self, data):
-        try:
-            from cStringIO import StringIO
-        except ImportError:
-            from io import StringIO
         import textwrap
 
         sections = zc.buildout.configparser.parse(
@@ -1408,10 +2050,21 @@ class Options(DictMixin):
         self._raw = data
         self._cooked = {}
         self._data = {}
+        self._context = None
+
+    @property
+    def context(self):
+        """The execution context the section's recipe runs commands in
+        """
+        if self._context is None:
+            self._context = zc.buildout.context.Context(
+                self.buildout['buildout']['directory'])
+        return self._context
 
     def _initialize(self):
         name = self.name
         __doing__ = 'Initializing section %s.', name
+        self.buildout.dependency_graph.add(name)
 
         if '<' in self._raw:
             self._raw = self._do_extend_raw(name, self._raw, [])
@@ -1426,6 +2079,7 @@ class Options(DictMixin):
 
         for dname in self.get('<part-dependencies>', '').split():
             # force use of dependencies in buildout:
+            self.buildout.dependency_graph.add(name, dname)
             self.buildout[dname]
 
         if self.get('recipe'):
@@ -1462,8 +2116,8 @@ class Options(DictMixin):
                     raise zc.buildout.UserError("No section named %r" % iname)
                 result.update(self._do_extend_raw(iname, raw, doing))
 
-            result = _annotate_section(result, "")
-            data = _annotate_section(copy.deepcopy(data), "")
+            result = _annotate_section(result, "", False)
+            data = _annotate_section(dict(data), "", False)
             _update_section(result, data)
             result = _unannotate_section(result)
             result.pop('<', None)
@@ -1473,8 +2127,8 @@ class Options(DictMixin):
 
     def _dosub(self, option, v):
         __doing__ = 'Getting option %s:%s.', self.name, option
-        seen = [(self.name, option)]
-        v = '$$'.join([self._sub(s, seen) for s in v.split('$$')])
+        seen = set([(self.name, option)])
+        v = self._substitute(self._parse_substitutions(v), seen)
         self._cooked[option] = v
 
     def get(self, option, default=None, seen=None):
@@ -1494,15 +2148,15 @@ class Options(DictMixin):
         if '${' in v:
             key = self.name, option
             if seen is None:
-                seen = [key]
+                seen = set([key])
             elif key in seen:
                 raise zc.buildout.UserError(
                     "Circular reference in substitutions.\n"
                     )
             else:
-                seen.append(key)
-            v = '$$'.join([self._sub(s, seen) for s in v.split('$$')])
-            seen.pop()
+                seen.add(key)
+            v = self._substitute(self._parse_substitutions(v), seen)
+            seen.remove(key)
 
         self._data[option] = v
         return v
@@ -1511,33 +2165,28 @@ class Options(DictMixin):
     _simple = re.compile('[-a-zA-Z0-9 ._]+$').match
     _valid = re.compile(r'\${[-a-zA-Z0-9 ._]*:[-a-zA-Z0-9 ._]+}$').match
     def _sub(self, template, seen):
-        value = self._template_split(template)
-        subs = []
-        for ref in value[1::2]:
-            s = tuple(ref[2:-1].split(':'))
-            if not self._valid(ref):
-                if len(s) < 2:
-                    raise zc.buildout.UserError("The substitution, %s,\n"
-                                                "doesn't contain a colon."
-                                                % ref)
-                if len(s) > 2:
-                    raise zc.buildout.UserError("The substitution, %s,\n"
-                                                "has too many colons."
-                                                % ref)
-                if not self._simple(s[0]):
-                    raise zc.buildout.UserError(
-                        "The section name in substitution, %s,\n"
-                        "has invalid characters."
-                        % ref)
-                if not self._simple(s[1]):
-                    raise zc.buildout.UserError(
-                        "The option name in substitution, %s,\n"
-                        "has invalid characters."
-                        % ref)
+        return self._substitute(self._parse_substitutions(template), seen)
+
+    def _parse_substitutions(self, value):
+        # Values are parsed once per buildout, rather than kept for the
+        # life of the process.
+        return _parse_substitutions(
+            value, self.buildout._parsed_substitutions)
+
+    def _substitute(self, tokens, seen):
+        # tokens are as returned by _parse_substitutions
+        result = []
+        for token in tokens:
+            if not isinstance(token, tuple):
+                result.append(token)
+                continue
 
-            section, option = s
+            section, option, error = token
+            if error:
+                raise zc.buildout.UserError(error)
             if not section:
                 section = self.name
+            self.buildout.dependency_graph.add(self.name, section)
             v = self.buildout[section].get(option, None, seen)
             if v is None:
                 if option == '_buildout_section_name_':
@@ -1545,10 +2194,9 @@ class Options(DictMixin):
                 else:
                     raise MissingOption("Referenced option does not exist:",
                                         section, option)
-            subs.append(v)
-        subs.append('')
+            result.append(v)
 
-        return ''.join([''.join(v) for v in zip(value[::2], subs)])
+        return ''.join(result)
 
     def __getitem__(self, key):
         try:
@@ -1589,17 +2237,34 @@ class Options(DictMixin):
         return len(self.keys())
 
     def copy(self):
-        result = copy.deepcopy(self._raw)
+        result = dict(self._raw)
         result.update(self._cooked)
         result.update(self._data)
         return result
 
     def _call(self, f):
+        if getattr(getattr(self, 'recipe', None), 'uses_context', False):
+            # The recipe runs its commands in its context, rather than
+            # in the working directory, so it can run at the same time
+            # as other recipes.
+            return self._call_in_context(f)
+
+        # Recipes that don't use their context expect to run in the
+        # buildout directory, and may change it, so they're run one at
+        # a time.
         buildout_directory = self.buildout['buildout']['directory']
+        with self.buildout._working_directory_lock:
+            os.chdir(buildout_directory)
+            try:
+                return self._call_in_context(f)
+            finally:
+                os.chdir(buildout_directory)
+
+    def _call_in_context(self, f):
         self._created = []
+        context = zc.buildout.context.activate(self.context)
         try:
             try:
-                os.chdir(buildout_directory)
                 return f()
             except:
                 for p in self._created:
@@ -1612,7 +2277,7 @@ class Options(DictMixin):
                 raise
         finally:
             self._created = None
-            os.chdir(buildout_directory)
+            zc.buildout.context.activate(context)
 
     def created(self, *paths):
         try:
@@ -1628,6 +2293,55 @@ class Options(DictMixin):
 
 Buildout.Options = Options
 
+def _parse_substitutions(value, parsed=None):
+    """Split an option value into literal text and substitutions.
+
+    The result is a tuple with strings for the literal text and
+    (section, option, error) tuples for the ${section:option}
+    substitutions, error being the message to raise a UserError with
+    for invalid ones.  If a dictionary of values parsed so far is
+    passed, values are only parsed once.
+    """
+    if parsed is not None:
+        try:
+            return parsed[value]
+        except KeyError:
+            pass
+
+    tokens = []
+    for i, template in enumerate(value.split('$$')):
+        if i:
+            tokens.append('$$')
+        split = Options._template_split(template)
+        for literal, ref in zip(split[::2], split[1::2]):
+            if literal:
+                tokens.append(literal)
+            s = tuple(ref[2:-1].split(':'))
+            error = None
+            if not Options._valid(ref):
+                if len(s) < 2:
+                    error = ("The substitution, %s,\n"
+                             "doesn't contain a colon." % ref)
+                elif len(s) > 2:
+                    error = ("The substitution, %s,\n"
+                             "has too many colons." % ref)
+                elif not Options._simple(s[0]):
+                    error = ("The section name in substitution, %s,\n"
+                             "has invalid characters." % ref)
+                elif not Options._simple(s[1]):
+                    error = ("The option name in substitution, %s,\n"
+                             "has invalid characters." % ref)
+            if error:
+                s = None, None
+            tokens.append(s + (error,))
+        if split[-1]:
+            tokens.append(split[-1])
+
+    tokens = tuple(tokens)
+    if parsed is not None:
+        parsed[value] = tokens
+    return tokens
+
 _spacey_nl = re.compile('[ \t\r\f\v]*\n[ \t\r\f\v\n]*'
                         '|'
                         '^[ \t\r\f\v]+'
@@ -1672,8 +2386,25 @@ def _save_options(section, options, f):
     for option, value in items:
         _save_option(option, value, f)
 
+def _save_installed_sections(installed_options, f):
+    _save_options('buildout', installed_options['buildout'], f)
+    for part in installed_options['buildout']['parts'].split():
+        print_(file=f)
+        _save_options(part, installed_options[part], f)
+
+_default_globals_defs = {}
+
 def _default_globals():
     """Return a mapping of default and precomputed expressions.
+
+    They are only computed once; every caller gets its own copy.
+    """
+    if not _default_globals_defs:
+        _default_globals_defs.update(_compute_default_globals())
+    return dict(_default_globals_defs)
+
+def _compute_default_globals():
+    """Return a mapping of default and precomputed expressions.
     These default expressions are convenience defaults available when eveluating
     section headers expressions.
     NB: this is wrapped in a function so that the computing of these expressions
@@ -1751,19 +2482,150 @@ def _default_globals():
 
     return globals_defs
 
-def _open(base, filename, seen, dl_options, override, downloaded):
+class _Fetch(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = self.error = None
+
+
+class _ExtendsPrefetcher(object):
+    """Download remote extended configuration ahead of _open.
+
+    As soon as the names a configuration extends are known, the remote
+    ones are downloaded by worker threads, which also look for the
+    files those extend in turn.  _open still reads and merges files
+    depth-first, so the result doesn't depend on the order in which
+    downloads finish.
+    """
+
+    def __init__(self, download, jobs):
+        self.download = download
+        self.jobs = jobs
+        self._fetches = {}
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def prefetch(self, base, names):
+        for name in names:
+            if _isurl(name):
+                url = name
+            elif _isurl(base) and not os.path.isabs(name):
+                url = base + '/' + name
+            else:
+                # Local files are read by _open, which will call us
+                # with what they extend.
+                continue
+            self._schedule(url)
+
+    def _schedule(self, url):
+        # Return the fetch of a url, starting it if it isn't known yet.
+        # Once the prefetcher is closed, nothing is started.
+        with self._lock:
+            fetch = self._fetches.get(url)
+            if fetch is not None or self._closed:
+                return fetch
+            fetch = self._fetches[url] = _Fetch()
+            if len(self._threads) < self.jobs:
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+            # Queued holding the lock, so that close can't tell the
+            # workers to stop before the url is fetched.
+            self._queue.put(url)
+        return fetch
+
+    def _work(self):
+        while True:
+            url = self._queue.get()
+            if url is None:
+                return
+            fetch = self._fetches[url]
+            try:
+                fetch.result = self.download(url)
+            except Exception:
+                fetch.error = sys.exc_info()
+                fetch.done.set()
+                continue
+            try:
+                extends = _read_extends(fetch.result[0])
+            except Exception:
+                # _open will report the problem when it gets here.
+                extends = ()
+            self.prefetch(url[:url.rfind('/')], extends)
+            fetch.done.set()
+
+    def get(self, url):
+        """Return the local path of a downloaded configuration file.
+
+        The path stays valid until the prefetcher is closed.
+        """
+        fetch = self._schedule(url)
+        if fetch is None:
+            raise ValueError("The prefetcher is closed", url)
+        fetch.done.wait()
+        if fetch.error is not None:
+            # Raised with the traceback of the worker thread.
+            _reraise(fetch.error)
+        return fetch.result[0]
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            for thread in self._threads:
+                self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        for fetch in self._fetches.values():
+            if fetch.result is not None:
+                path, is_temp = fetch.result
+                if is_temp:
+                    os.remove(path)
+
+
+def _read_extends(path):
+    with open(path) as fp:
+        result = zc.buildout.configparser.parse(fp, path, _default_globals)
+    return result.get('buildout', {}).get('extends', '').split()
+
+def _cpu_count():
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except (ImportError, NotImplementedError):
+        return 1
+
+def _jobs_option(options, name, default):
+    jobs = options.get(name, default)
+    try:
+        return int(jobs)
+    except ValueError:
+        raise zc.buildout.UserError(
+            'Invalid value for %r option: %r' % (name, jobs))
+
+def _extends_download(_dl_options, fallback):
+    return zc.buildout.download.Download(
+        _dl_options, cache=_dl_options.get('extends-cache'),
+        fallback=fallback, hash_name=True)
+
+def _open(base, filename, seen, dl_options, override, downloaded,
+          prefetcher=None, record_history=True):
     """Open a configuration file and return the result as a dictionary,
 
     Recursively open other files based on buildout options found.
     """
     _update_section(dl_options, override)
-    dl_options_copy = copy.deepcopy(dl_options)
-    _dl_options = _unannotate_section(dl_options_copy)
+    _dl_options = _section_values(dl_options)
     newest = bool_option(_dl_options, 'newest', 'false')
     fallback = newest and not (filename in downloaded)
-    download = zc.buildout.download.Download(
-        _dl_options, cache=_dl_options.get('extends-cache'),
-        fallback=fallback, hash_name=True)
+    if prefetcher is None:
+        download = _extends_download(_dl_options, fallback)
+    else:
+        # The prefetcher cleans up its temporary files itself.
+        download = lambda url: (prefetcher.get(url), False)
     is_temp = False
     downloaded_filename = None
     if _isurl(filename):
@@ -1812,63 +2674,465 @@ def _open(base, filename, seen, dl_options, override, downloaded):
             'No-longer supported "extended-by" option found in %s.' %
             filename)
 
-    result = _annotate(result, filename)
+    result = _annotate(result, filename, record_history)
 
     if root_config_file and 'buildout' in result:
         dl_options = _update_section(dl_options, result['buildout'])
 
     if extends:
         extends = extends.split()
-        eresult = _open(base, extends.pop(0), seen, dl_options, override,
-                        downloaded)
-        for fname in extends:
-            _update(eresult, _open(base, fname, seen, dl_options, override,
-                    downloaded))
+        own_prefetcher = False
+        if prefetcher is None:
+            # Extended files are read with the download options as they
+            # are now, plus the command-line overrides.
+            prefetch_options = _section_values(
+                _update_section(_copy_section(dl_options), override))
+            jobs = _jobs_option(prefetch_options, 'extends-jobs', '4')
+            if jobs > 1:
+                prefetcher = _ExtendsPrefetcher(
+                    _extends_download(prefetch_options, newest), jobs)
+                own_prefetcher = True
+        if prefetcher is not None:
+            prefetcher.prefetch(base, extends)
+        try:
+            eresult = _open(base, extends.pop(0), seen, dl_options, override,
+                            downloaded, prefetcher, record_history)
+            for fname in extends:
+                _update(eresult, _open(base, fname, seen, dl_options,
+                                       override, downloaded, prefetcher,
+                                       record_history))
+        finally:
+            if own_prefetcher:
+                prefetcher.close()
         result = _update(eresult, result)
 
     seen.pop()
     return result
 
 
+# Bump this when the pickled form of annotated configuration changes.
+_config_cache_format = 2
+
+def _config_cache_directory(buildout_options, override):
+    """Return the absolute path of the configuration cache, if any.
+
+    The cache has to be known before the configuration files are read,
+    so it can only be set in the user defaults or on the command line.
+    """
+    sectionkey = override.get('config-cache',
+                              buildout_options.get('config-cache'))
+    if sectionkey is None or not sectionkey.value:
+        return None
+    if '${' in sectionkey.value:
+        return None
+    directory = os.path.expanduser(sectionkey.value)
+    if not os.path.isabs(directory):
+        source = sectionkey.source
+        if source in ('DEFAULT_VALUE', 'COMPUTED_VALUE',
+                      'COMMAND_LINE_VALUE') or _isurl(source):
+            basedir = os.getcwd()
+        else:
+            basedir = os.path.dirname(source)
+        directory = os.path.join(basedir, directory)
+    return os.path.abspath(directory)
+
+def _config_cache_key(config_file, buildout_options, override,
+                      record_history):
+    # Everything that can influence how the configuration files are read
+    # and merged: the user defaults (which provide the download options),
+    # the command-line overrides, the interpreter evaluating section
+    # conditions and whether the history of values is recorded.
+    key = repr((
+        _config_cache_format,
+        record_history,
+        config_file,
+        sorted((k, v.value) for (k, v) in buildout_options.items()),
+        sorted((k, v.value) for (k, v) in override.items()),
+        sys.executable,
+        sys.version,
+        sys.platform,
+        ))
+    return md5(key.encode('utf-8')).hexdigest()
+
+def _file_digest(path):
+    with open(path, 'rb') as f:
+        return md5(f.read()).hexdigest()
+
+def _load_cached_config(directory, key):
+    """Return the cached result of reading a configuration, or None.
+
+    The cached result is only used if none of the files it was read from
+    have changed.
+    """
+    path = os.path.join(directory, key)
+    try:
+        with open(path, 'rb') as f:
+            files, result = pickle.load(f)
+    except Exception:
+        # Missing, truncated or written by an incompatible version.
+        return None
+    for filename, digest in files:
+        try:
+            if _file_digest(filename) != digest:
+                return None
+        except (IOError, OSError):
+            return None
+    logging.getLogger('zc.buildout').debug(
+        'Using cached configuration %s', path)
+    return result
+
+def _save_cached_config(directory, key, filenames, result):
+    if [filename for filename in filenames if _isurl(filename)]:
+        # Remote configuration can change without us being able to tell
+        # cheaply, so don't cache it.
+        return
+    files = [(filename, _file_digest(filename))
+             for filename in sorted(filenames)]
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    path = os.path.join(directory, key)
+    fd, tmp = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump((files, result), f, pickle.HIGHEST_PROTOCOL)
+    _replace(tmp, path)
+
+_fsync = getattr(os, 'fsync', lambda fileno: None)
+
+def _write_file(path, text):
+    # Write a file so that it's either completely written or unchanged,
+    # even if we're interrupted.
+    tmp = path + '.tmp'
+    try:
+        with open(tmp, 'w') as f:
+            f.write(text)
+            f.flush()
+            _fsync(f.fileno())
+        _replace(tmp, path)
+    except:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
 ignore_directories = '.svn', 'CVS', '__pycache__'
 _dir_hashes = {}
-def _dir_hash(dir):
-    dir_hash = _dir_hashes.get(dir, None)
+def _dir_hash(dir, algorithm='md5', jobs=1, cache=None):
+    # Hash a directory with a hashlib algorithm.  The md5 hash is
+    # computed as in earlier versions, for compatibility with the
+    # signatures of existing buildouts, but its files are read ahead by
+    # up to the given number of threads.  With other algorithms, the
+    # files are hashed by the threads.  The cache is a _DirHashCache, if
+    # the develop-hash-cache option is used.
+    dir_hash = _dir_hashes.get((dir, algorithm))
     if dir_hash is not None:
         return dir_hash
-    hash = md5()
+    tree = []
+    stats = {}
+    files = md5()
     for (dirpath, dirnames, filenames) in os.walk(dir):
         dirnames[:] = sorted(n for n in dirnames if n not in ignore_directories)
-        filenames[:] = sorted(f for f in filenames
-                              if (not (f.endswith('pyc') or f.endswith('pyo'))
-                                  and os.path.exists(os.path.join(dirpath, f)))
-                          )
-        for_hash = ' '.join(dirnames + filenames)
-        if isinstance(for_hash, text_type):
-            for_hash = for_hash.encode()
-        hash.update(for_hash)
+        names = []
+        for f in sorted(filenames):
+            if f.endswith('pyc') or f.endswith('pyo'):
+                continue
+            path = os.path.join(dirpath, f)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            names.append(f)
+            stats[path] = [st.st_size,
+                           getattr(st, 'st_mtime_ns', st.st_mtime),
+                           st.st_ino]
+            files.update(repr((dirpath, f, st.st_size,
+                               getattr(st, 'st_mtime_ns', st.st_mtime),
+                               st.st_ino)).encode('utf-8'))
+        filenames[:] = names
+        tree.append((dirpath, dirnames[:], filenames))
+        files.update(repr(dirnames).encode('utf-8'))
+    files = algorithm + ' ' + files.hexdigest()
+
+    if cache is not None and algorithm == 'md5':
+        # The md5 hash of a directory can't be made of hashes of its
+        # files, so it's kept as a whole.
+        dir_hash = cache.get_directory(dir, files)
+        if dir_hash is not None:
+            _dir_hashes[(dir, algorithm)] = dir_hash
+            return dir_hash
+
+    paths = [os.path.join(dirpath, name)
+             for (dirpath, dirnames, filenames) in tree
+             for name in filenames]
+    jobs = max(min(jobs, len(paths) // 10), 1)
+    if algorithm == 'md5':
+        hash = md5()
+        contents = _read_ahead(paths, stats, jobs)
+        for (dirpath, dirnames, filenames) in tree:
+            hash.update(_names_for_hash(dirnames, filenames))
+            for name in filenames:
+                path, data = next(contents)
+                if data is None:
+                    _hash_file(hash, path)
+                else:
+                    hash.update(data)
+        dir_hash = hash.hexdigest()
+    else:
+        dir_hash = _tree_hash(tree, paths, algorithm, jobs, cache, stats)
+    _dir_hashes[(dir, algorithm)] = dir_hash
+    if cache is not None and algorithm == 'md5':
+        cache.set_directory(dir, files, dir_hash)
+    return dir_hash
+
+_read_ahead_size = 1 << 23
+def _read_ahead(paths, stats, jobs):
+    # Generate the paths of files along with the data to md5 hash them
+    # with, read by threads while the caller hashes the data of the
+    # files before them, up to about _read_ahead_size bytes ahead.
+    # Files bigger than a megabyte are generated without data, to be
+    # hashed in chunks by the caller.
+    if jobs == 1:
+        for path in paths:
+            yield path, None
+        return
+    big = set(path for path in paths if stats[path][0] > 1 << 20)
+    batches = [[]]
+    size = 0
+    for path in paths:
+        if path not in big:
+            size += stats[path][0]
+            if size > _read_ahead_size and batches[-1]:
+                batches.append([])
+                size = stats[path][0]
+        batches[-1].append(path)
+    def read(path):
+        if path not in big:
+            return _data_for_hash(path)
+    pending = _map_paths(read, batches[0], jobs)
+    for i, batch in enumerate(batches):
+        contents = pending()
+        if i + 1 < len(batches):
+            pending = _map_paths(read, batches[i + 1], jobs)
+        for path, data in zip(batch, contents):
+            yield path, data
+
+def _map_paths(function, paths, jobs):
+    # Call the function with each of the paths, in up to the given
+    # number of threads.  Returns a function that waits for the threads
+    # and returns the results.  It re-raises the error of the first path
+    # the function failed for, as if the paths had been handled in this
+    # thread.
+    results = [None] * len(paths)
+    errors = []
+    def call(indexes):
+        for i in indexes:
+            try:
+                results[i] = function(paths[i])
+            except Exception:
+                errors.append((i, sys.exc_info()))
+                return
+    jobs = max(min(jobs, len(paths)), 1)
+    threads = [threading.Thread(target=call,
+                                args=(range(i, len(paths), jobs), ))
+               for i in range(jobs)]
+    for thread in threads:
+        thread.start()
+    def join():
+        for thread in threads:
+            thread.join()
+        if errors:
+            i, exc_info = min(errors, key=lambda error: error[0])
+            error = exc_info[1]
+            if isinstance(error, EnvironmentError) and not error.filename:
+                error.filename = paths[i]
+            _reraise(exc_info)
+        return results
+    return join
+
+def _tree_hash(tree, paths, algorithm, jobs, cache=None, stats=None):
+    # Hash the files separately, in threads, and hash their hashes
+    # along with the directory listings.  The hashes of files whose
+    # stats (size, modification time and inode) are in the cache are
+    # taken from it.
+    def hash_file(path):
+        digest = None
+        if cache is not None:
+            digest = cache.get_file(path, stats[path], algorithm)
+        if digest is None:
+            hash = hashlib.new(algorithm)
+            _hash_file(hash, path, algorithm)
+            digest = hash.hexdigest()
+            if cache is not None:
+                cache.set_file(path, stats[path], algorithm, digest)
+        return digest
+    digests = iter(_map_paths(hash_file, paths, jobs)())
+
+    hash = hashlib.new(algorithm)
+    for (dirpath, dirnames, filenames) in tree:
+        hash.update(_names_for_hash(dirnames, filenames))
         for name in filenames:
-            path = os.path.join(dirpath, name)
-            if name == 'entry_points.txt':
-                f = open(path)
-                # Entry points aren't written in stable order. :(
-                try:
-                    sections = zc.buildout.configparser.parse(f, path)
-                    data = repr([(sname, sorted(sections[sname].items()))
-                                 for sname in sorted(sections)]).encode('utf-8')
-                except Exception:
-                    f.close()
-                    f = open(path, 'rb')
-                    data = f.read()
-            else:
-                f = open(path, 'rb')
-                data = f.read()
-            f.close()
+            hash.update(next(digests).encode('ascii'))
+    return algorithm + '-' + hash.hexdigest()
+
+def _names_for_hash(dirnames, filenames):
+    names = ' '.join(dirnames + filenames)
+    if isinstance(names, text_type):
+        names = names.encode()
+    return names
+
+def _entry_points_for_hash(path, algorithm='md5'):
+    # Entry points aren't written in stable order. :(
+    if algorithm == 'md5':
+        # Parsed as in earlier versions, for the same md5 hashes.
+        try:
+            with open(path) as f:
+                sections = zc.buildout.configparser.parse(f, path)
+        except Exception:
+            return None
+        return repr([(sname, sorted(sections[sname].items()))
+                     for sname in sorted(sections)]).encode('utf-8')
+    sections = [[b'']]
+    with open(path, 'rb') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith(b'['):
+                sections.append([line])
+            elif line:
+                sections[-1].append(line)
+    return b'\n'.join(b'\n'.join([section[0]] + sorted(section[1:]))
+                      for section in sorted(sections))
+
+def _data_for_hash(path, algorithm='md5'):
+    if os.path.basename(path) == 'entry_points.txt':
+        data = _entry_points_for_hash(path, algorithm)
+        if data is not None:
+            return data
+    with open(path, 'rb') as f:
+        return f.read()
+
+def _hash_file(hash, path, algorithm='md5'):
+    if os.path.basename(path) == 'entry_points.txt':
+        data = _entry_points_for_hash(path, algorithm)
+        if data is not None:
+            hash.update(data)
+            return
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(1 << 20), b''):
             hash.update(data)
-    _dir_hashes[dir] = dir_hash = hash.hexdigest()
-    return dir_hash
 
-def _dists_sig(dists):
+
+class _DirHashCache(object):
+    """Hashes of the files of develop egg directories, kept between runs.
+
+    The hash of a file is used again as long as its size, modification
+    time and inode are the same, so only the files that changed are read.
+    The md5 hashes of whole directories, which can't be made of hashes of
+    their files, are kept too, and used again as long as none of their
+    files changed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.changed = False
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            self.files = dict(data['files'])
+            self.directories = dict(data['directories'])
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            self.files = {}
+            self.directories = {}
+
+    def get_file(self, path, stat, algorithm):
+        cached = self.files.get(path)
+        if cached is not None and cached[:4] == stat + [algorithm]:
+            return str(cached[4])
+        return None
+
+    def set_file(self, path, stat, algorithm, digest):
+        with self._lock:
+            self.files[path] = stat + [algorithm, digest]
+            self.changed = True
+
+    def get_directory(self, dir, files):
+        cached = self.directories.get(dir)
+        if cached is not None and cached[0] == files:
+            return str(cached[1])
+        return None
+
+    def set_directory(self, dir, files, dir_hash):
+        with self._lock:
+            self.directories[dir] = [files, dir_hash]
+            self.changed = True
+
+    def save(self):
+        if self.changed:
+            _write_file(self.path, json.dumps(
+                dict(files=self.files, directories=self.directories),
+                sort_keys=True))
+            self.changed = False
+
+# Options saved with installed parts that aren't part of their
+# configuration.
+_installed_state_options = (
+    '__buildout_fingerprint__',
+    '__buildout_installed__',
+    '__buildout_manifest__',
+    )
+
+def _configured_options(installed_options):
+    # Installed options are copied so that their values aren't
+    # substituted.
+    return dict((k, v) for (k, v) in installed_options.copy().items()
+                if k not in _installed_state_options)
+
+def _options_fingerprint(options):
+    # Hash the configuration of a part, including its recipe signature,
+    # so it can be compared with the installed one quickly.
+    items = sorted((k, v) for (k, v) in options.items()
+                   if k not in _installed_state_options)
+    return md5(json.dumps(items).encode('ascii')).hexdigest()
+
+def _develop_fingerprint(setup, egg_link):
+    # Describe the state of a develop egg and of the files it was made
+    # from: the setup script and configuration files, and the egg-info
+    # metadata.  None is returned if the egg can't be reused.
+    if os.path.isdir(setup):
+        directory = setup
+    else:
+        directory = os.path.dirname(setup)
+    egg_name = os.path.basename(egg_link)[:-len('.egg-link')]
+    if egg_name in zc.buildout.easy_install._develop_distutils_scripts:
+        # The scripts are only found when running setup.py develop.
+        return None
+    try:
+        with open(egg_link) as f:
+            location = os.path.join(directory, f.readline().strip())
+        paths = [os.path.join(directory, name)
+                 for name in ('setup.py', 'setup.cfg', 'pyproject.toml')]
+        if setup not in paths and not os.path.isdir(setup):
+            paths.append(setup)
+        for name in sorted(os.listdir(location)):
+            if name.endswith('.egg-info'):
+                egg_info = os.path.join(location, name)
+                paths.append(egg_info)
+                if os.path.isdir(egg_info):
+                    paths.extend(os.path.join(egg_info, info_name)
+                                 for info_name in sorted(os.listdir(egg_info)))
+    except (IOError, OSError):
+        return None
+    paths.append(egg_link)
+    data = [sys.executable]
+    for path in paths:
+        fingerprint = zc.buildout.installed.fingerprint(path)
+        if fingerprint == '':
+            # Directories get an empty fingerprint; we want their
+            # content only.
+            continue
+        data.append((path, fingerprint))
+    return md5(repr(data).encode('utf-8')).hexdigest()
+
+def _dists_sig(dists, dir_hash=_dir_hash):
     seen = set()
     result = []
     for dist in sorted(dists):
@@ -1877,34 +3141,39 @@ def _dists_sig(dists):
         seen.add(dist)
         location = dist.location
         if dist.precedence == pkg_resources.DEVELOP_DIST:
-            result.append(dist.project_name + '-' + _dir_hash(location))
+            result.append(dist.project_name + '-' + dir_hash(location))
         else:
             result.append(os.path.basename(location))
     return result
 
 def _update_section(s1, s2):
-    # Base section 2 on section 1; section 1 is copied, with key-value pairs
+    # Base section 2 on section 1; section 1 is updated, with key-value pairs
     # in section 2 overriding those in section 1. If there are += or -=
     # operators in section 2, process these to add or substract items (delimited
     # by newlines) from the preexisting values.
-    s2 = copy.deepcopy(s2) # avoid mutating the second argument, which is unexpected
+    # Section 2 isn't mutated, which would be unexpected.  Rather than copying
+    # it as a whole, only the values that change are copied.
+    s2 = dict(s2)
+    changing = set()
+
+    def changeable(key, sectionkey):
+        if key not in changing:
+            changing.add(key)
+            if key in s2:
+                # Defined locally too, or set by a += operation first.
+                s2[key] = s2[key].copy()
+            else:
+                s2[key] = s1.get(key) or SectionKey(
+                    "", "IMPLICIT_VALUE", sectionkey.history is not None)
+        return s2[key]
+
     # Sort on key, then on the addition or substraction operator (+ comes first)
     for k, v in sorted(s2.items(), key=lambda x: (x[0].rstrip(' +'), x[0][-1])):
         if k.endswith('+'):
-            key = k.rstrip(' +')
-            implicit_value = SectionKey("", "IMPLICIT_VALUE")
-            # Find v1 in s2 first; it may have been defined locally too.
-            section_key = s2.get(key, s1.get(key, implicit_value))
-            section_key.addToValue(v.value, v.source)
-            s2[key] = section_key
+            changeable(k.rstrip(' +'), v).addToValue(v.value, v.source)
             del s2[k]
         elif k.endswith('-'):
-            key = k.rstrip(' -')
-            implicit_value = SectionKey("", "IMPLICIT_VALUE")
-            # Find v1 in s2 first; it may have been set by a += operation first
-            section_key = s2.get(key, s1.get(key, implicit_value))
-            section_key.removeFromValue(v.value, v.source)
-            s2[key] = section_key
+            changeable(k.rstrip(' -'), v).removeFromValue(v.value, v.source)
             del s2[k]
 
     _update_verbose(s1, s2)
@@ -1916,7 +3185,7 @@ def _update_verbose(s1, s2):
             v1 = s1[key]
             v1.overrideValue(v2)
         else:
-            s1[key] = v2
+            s1[key] = v2.copy()
 
 def _update(d1, d2):
     for section in d2:
@@ -1961,6 +3230,149 @@ An internal error occurred due to a bug in either zc.buildout or in a
 recipe being used:
 """
 
+class _LogBuffer(logging.Filter):
+    """Hold back the log records of threads, to log them later.
+
+    The buffer is added as a filter to log handlers.  Records logged by
+    a thread between start and stop are kept in the list start returned
+    instead of being handled.
+    """
+
+    def __init__(self):
+        logging.Filter.__init__(self)
+        self._records = {}
+
+    def start(self):
+        records = self._records[threading.current_thread().ident] = []
+        return records
+
+    def stop(self):
+        del self._records[threading.current_thread().ident]
+
+    def filter(self, record):
+        # Handlers are called by the thread logging the record.
+        records = self._records.get(threading.current_thread().ident)
+        if records is None:
+            return True
+        # A record can go to several handlers, but is kept once.
+        if not (records and records[-1] is record):
+            records.append(record)
+        return False
+
+    def emit(self, records):
+        for record in records:
+            logging.getLogger(record.name).handle(record)
+
+
+class _Installation(object):
+    """The state of installed parts while installing parts.
+    """
+
+    def __init__(self, options, parts, exists, order):
+        self.options = options
+        self.parts = parts
+        self.exists = exists
+        self.order = list(order)
+        self.lock = threading.RLock()
+
+    def add(self, part):
+        # Record an installed part after the parts that aren't being
+        # installed, and in the order of the parts being installed,
+        # even if they're installed at the same time.
+        parts = set(self.parts)
+        parts.add(part)
+        self.parts = ([p for p in self.parts if p not in self.order]
+                      + [p for p in self.order if p in parts])
+
+
+class _Trash(object):
+    """Directories being removed in the background.
+
+    Directories are renamed into the trash directory first, so they're
+    gone from where they were at once.  Whatever is in the trash
+    directory, including what's left from an interrupted buildout, is
+    removed by worker threads.  The paths that couldn't be removed are
+    kept in ``errors``.
+    """
+
+    def __init__(self, directory, jobs):
+        self.directory = directory
+        self.jobs = jobs
+        self.errors = []
+        self._queue = queue.Queue()
+        self._threads = []
+        self._started = False
+
+    def _start(self):
+        if not self._started:
+            self._started = True
+            if os.path.isdir(self.directory):
+                for name in os.listdir(self.directory):
+                    self._remove(os.path.join(self.directory, name))
+
+    def put(self, path):
+        """Move a directory to the trash, returning whether it could be
+
+        It can't be if it's on another file system than the trash, for
+        example.
+        """
+        self._start()
+        if not os.path.isdir(self.directory):
+            os.mkdir(self.directory)
+        # The directory is put in a new directory of its own, as the
+        # names of the directories in the trash may clash.
+        container = tempfile.mkdtemp(dir=self.directory)
+        try:
+            os.rename(path, os.path.join(container, os.path.basename(path)))
+        except OSError:
+            os.rmdir(container)
+            return False
+        self._remove(container)
+        return True
+
+    def _remove(self, path):
+        self._queue.put(path)
+        if len(self._threads) < self.jobs:
+            thread = threading.Thread(
+                target=self._work, name='zc.buildout trash')
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            path = self._queue.get()
+            if path is None:
+                break
+            try:
+                rmtree(path)
+            except Exception:
+                logging.getLogger('zc.buildout').error(
+                    "Couldn't remove %s", path, exc_info=True)
+                self.errors.append(path)
+
+    def join(self):
+        """Wait until everything in the trash is removed
+        """
+        self._start()
+        for thread in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if os.path.isdir(self.directory) and not os.listdir(self.directory):
+            os.rmdir(self.directory)
+
+    def check(self):
+        """Raise a UserError if directories couldn't be removed
+        """
+        if self.errors:
+            errors, self.errors = self.errors, []
+            raise zc.buildout.UserError(
+                "Couldn't remove the uninstalled directories:\n  %s\n"
+                "They're left in %s." % (
+                    '\n  '.join(sorted(errors)), self.directory))
+
+
 def _check_for_unused_options_in_section(buildout, section):
     options = buildout[section]
     unused = [option for option in sorted(options._raw)
@@ -2069,6 +3481,17 @@ Commands:
   query section:key
 
     Display value of given section key pair.
+
+  graph [dot|json]
+
+    Display the dependencies between the sections used by the parts,
+    as found in substitutions and part dependencies, in the Graphviz
+    dot format (the default) or as JSON.
+
+  installed
+
+    Display what's installed, in the format of the installed file,
+    whether it's kept there or in the installed database.
 """
 
 def _help():
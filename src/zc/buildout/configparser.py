@@ -111,6 +111,16 @@ option_start = re.compile(
 
 leading_blank_lines = re.compile(r"^(\s*\n)+")
 
+# Section expressions compiled so far, by source text.
+_compiled_expressions = {}
+
+def _compile_expression(expr):
+    try:
+        return _compiled_expressions[expr]
+    except KeyError:
+        code = _compiled_expressions[expr] = compile(expr, '<string>', 'eval')
+        return code
+
 def parse(fp, fpname, exp_globals=dict):
     """Parse a sectioned setup file.
 
@@ -139,6 +149,10 @@ def parse(fp, fpname, exp_globals=dict):
     cursect = None                            # None, or a dictionary
     blockmode = None
     optname = None
+    # Lines of the current option's value, if it has continuation lines.
+    # They are joined once the option ends, as joining them line by line
+    # would take quadratic time.
+    optlines = None
     lineno = 0
     e = None                                  # None, or an exception
     while True:
@@ -162,10 +176,16 @@ def parse(fp, fpname, exp_globals=dict):
                 line = line.strip()
                 if not line:
                     continue
-            cursect[optname] = "%s\n%s" % (cursect[optname], line)
+            if optlines is None:
+                optlines = [cursect[optname]]
+            optlines.append(line)
         else:
-            header = section_header(line)
+            # Section headers start right away with the opening bracket.
+            header = line[0] == '[' and section_header(line)
             if header:
+                if optlines:
+                    cursect[optname] = '\n'.join(optlines)
+                    optlines = None
                 # reset to True when starting a new section
                 section_condition = True
                 sectname = header.group('name')
@@ -185,7 +205,8 @@ def parse(fp, fpname, exp_globals=dict):
                     if not context:
                         context = exp_globals()
                     # evaluated expression is in list: get first element
-                    section_condition = eval(expr, context)[0]
+                    section_condition = eval(
+                        _compile_expression(expr), context)[0]
                     # finally, ignore section when an expression
                     # evaluates to false
                     if not section_condition:
@@ -214,6 +235,9 @@ def parse(fp, fpname, exp_globals=dict):
                         # filter out options of conditionally ignored section
                         continue
                     # option start line
+                    if optlines:
+                        cursect[optname] = '\n'.join(optlines)
+                        optlines = None
                     optname, optval = mo.group('name', 'value')
                     optname = optname.rstrip()
                     optval = optval.strip()
@@ -231,6 +255,9 @@ def parse(fp, fpname, exp_globals=dict):
                         e = ParsingError(fpname)
                     e.append(lineno, repr(line))
 
+    if optlines:
+        cursect[optname] = '\n'.join(optlines)
+
     # if any parsing errors occurred, raise an exception
     if e:
         raise e
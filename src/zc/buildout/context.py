@@ -0,0 +1,91 @@
+##############################################################################
+#
+# Copyright Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Execution contexts of recipes
+
+A context holds the directory and the additional environment variables
+commands started for a part run with.  Unlike the process's working
+directory and ``os.environ``, contexts aren't shared, so recipes using
+them can run at the same time in different threads.
+"""
+
+import os
+import threading
+
+
+class Context(object):
+    """The directory and environment variables commands run with
+
+    The environment variables are an overlay: they're added to
+    ``os.environ`` when commands are run, ``os.environ`` itself is
+    never changed.
+    """
+
+    def __init__(self, directory, environment=None):
+        self.directory = directory
+        self.environment = dict(environment or ())
+
+    def path(self, *names):
+        """Return a path relative to the context's directory
+        """
+        return os.path.join(self.directory, *names)
+
+    def environ(self):
+        """Return the environment variables commands are run with
+        """
+        result = dict(os.environ)
+        result.update(self.environment)
+        return result
+
+    def extend(self, environment=None, directory=None):
+        """Return a new context with more environment variables
+
+        The directory of the new context is relative to the directory
+        of this one.
+        """
+        if directory:
+            directory = self.path(directory)
+        result = Context(directory or self.directory, self.environment)
+        result.environment.update(environment or ())
+        return result
+
+    def subprocess_options(self, options):
+        """Add the context's directory and environment to subprocess options
+
+        Options that were already given are left alone.
+        """
+        options.setdefault('cwd', self.directory)
+        if self.environment:
+            options.setdefault('env', self.environ())
+        return options
+
+    def __repr__(self):
+        return 'Context(%r, %r)' % (self.directory, self.environment)
+
+
+_current = threading.local()
+
+def current():
+    """Return the context of the recipe running in this thread, or None
+    """
+    return getattr(_current, 'context', None)
+
+def activate(context):
+    """Make a context the current one of this thread
+
+    The context that was current before is returned, so it can be
+    activated again afterwards.
+    """
+    previous = current()
+    _current.context = context
+    return previous
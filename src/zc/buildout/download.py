@@ -20,35 +20,66 @@ except ImportError:
 
 try:
     # Python 3
+    from urllib.error import HTTPError
+    from urllib.request import Request
+    from urllib.request import urlopen
     from urllib.request import urlretrieve
     from urllib.parse import urlparse
+    from urllib.parse import urlunparse
 except ImportError:
     # Python 2
-    import base64
     from urlparse import urlparse
     from urlparse import urlunparse
-    import urllib2
+    from urllib2 import HTTPError
+    from urllib2 import Request
+    from urllib2 import urlopen
 
     def urlretrieve(url, tmp_path):
         """Work around Python issue 24599 includig basic auth support
         """
-        scheme, netloc, path, params, query, frag = urlparse(url)
-        auth, host = urllib2.splituser(netloc)
-        if auth:
-            url = urlunparse((scheme, host, path, params, query, frag))
-            req = urllib2.Request(url)
-            base64string = base64.encodestring(auth)[:-1]
-            basic = "Basic " + base64string
-            req.add_header("Authorization", basic)
-        else:
-            req = urllib2.Request(url)
-        url_obj = urllib2.urlopen(req)
+        return conditional_urlretrieve(url, tmp_path)
+
+
+def conditional_urlretrieve(url, tmp_path, validators=None):
+    """Retrieve a URL, possibly only if it changed.
+
+    validators: mapping with the ``etag`` and/or ``last-modified``
+                response headers of a previous download of the URL
+
+    Returns the path and the response headers, or None if the server
+    says that the resource didn't change.  Basic auth credentials in the
+    URL are supported.
+    """
+    scheme, netloc, path, params, query, frag = urlparse(url)
+    auth, _, host = netloc.rpartition('@')
+    if auth:
+        url = urlunparse((scheme, host, path, params, query, frag))
+    req = Request(url)
+    if auth:
+        basic = base64.b64encode(auth.encode()).decode()
+        req.add_header("Authorization", "Basic " + basic)
+    if validators:
+        if validators.get('etag'):
+            req.add_header('If-None-Match', validators['etag'])
+        if validators.get('last-modified'):
+            req.add_header('If-Modified-Since', validators['last-modified'])
+    try:
+        url_obj = urlopen(req)
+    except HTTPError:
+        if validators and sys.exc_info()[1].code == 304:
+            return None
+        raise
+    try:
         with open(tmp_path, 'wb') as fp:
-            fp.write(url_obj.read())
+            shutil.copyfileobj(url_obj, fp)
         return tmp_path, url_obj.info()
+    finally:
+        url_obj.close()
 
 
 from zc.buildout.easy_install import realpath
+import base64
+import json
 import logging
 import os
 import os.path
@@ -138,7 +169,12 @@ class Download(object):
                 % self.download_cache)
         cache_dir = self.cache_dir
         if not os.path.exists(cache_dir):
-            os.mkdir(cache_dir)
+            try:
+                os.mkdir(cache_dir)
+            except OSError:
+                # Another thread or process may have just created it.
+                if not os.path.isdir(cache_dir):
+                    raise
         cache_key = self.filename(url)
         cached_path = os.path.join(cache_dir, cache_key)
 
@@ -193,11 +229,28 @@ class Download(object):
             raise zc.buildout.UserError(
                 "Couldn't download %r in offline mode." % url)
 
+        validators = None
+        if path and self._in_cache(path) and os.path.exists(path):
+            # We have a cached copy, so only download the file if it
+            # changed since.
+            validators = read_validators(path, url)
+
         self.logger.info('Downloading %s' % url)
         handle, tmp_path = tempfile.mkstemp(prefix='buildout-')
         os.close(handle)
         try:
-            tmp_path, headers = urlretrieve(url, tmp_path)
+            if validators:
+                retrieved = conditional_urlretrieve(url, tmp_path, validators)
+                if retrieved is None:
+                    os.remove(tmp_path)
+                    self.logger.debug('Cached copy of %s is up to date' % url)
+                    if not check_md5sum(path, md5sum):
+                        raise ChecksumError(
+                            'MD5 checksum mismatch downloading %r' % url)
+                    return path, False
+                tmp_path, headers = retrieved
+            else:
+                tmp_path, headers = urlretrieve(url, tmp_path)
             if not check_md5sum(tmp_path, md5sum):
                 raise ChecksumError(
                     'MD5 checksum mismatch downloading %r' % url)
@@ -212,10 +265,16 @@ class Download(object):
 
         if path:
             shutil.move(tmp_path, path)
+            if self._in_cache(path):
+                write_validators(path, url, headers)
             return path, False
         else:
             return tmp_path, True
 
+    def _in_cache(self, path):
+        return (self.download_cache is not None and
+                realpath(os.path.dirname(path)) == realpath(self.cache_dir))
+
     def filename(self, url):
         """Determine a file name from a URL according to the configuration.
 
@@ -265,6 +324,62 @@ def check_md5sum(path, md5sum):
         f.close()
 
 
+# The validators of cached downloads are kept in a subdirectory of the
+# cache, so they can't be mistaken for, or overwrite, cached downloads.
+VALIDATORS_DIRECTORY = '.buildout-validators'
+
+
+def validators_path(path):
+    directory, name = os.path.split(path)
+    if name == VALIDATORS_DIRECTORY:
+        # A download with the name of the directory can't have any.
+        return None
+    return os.path.join(directory, VALIDATORS_DIRECTORY, name)
+
+
+def read_validators(path, url):
+    """Return the HTTP validators recorded for a cached download of url.
+
+    None is returned if nothing (usable) was recorded.
+
+    """
+    if validators_path(path) is None:
+        return None
+    try:
+        with open(validators_path(path)) as f:
+            validators = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(validators, dict) or validators.get('url') != url:
+        # The cached copy came from a different URL with the same name.
+        return None
+    return validators
+
+
+def write_validators(path, url, headers):
+    """Record the HTTP validators of a response for a cached file.
+
+    """
+    validators_file = validators_path(path)
+    if validators_file is None:
+        return
+    validators = {
+        'url': url,
+        'etag': headers.get('ETag'),
+        'last-modified': headers.get('Last-Modified'),
+        }
+    directory = os.path.dirname(validators_file)
+    if validators['etag'] or validators['last-modified']:
+        if not os.path.isdir(directory):
+            os.mkdir(directory)
+        with open(validators_file, 'w') as f:
+            json.dump(validators, f)
+    else:
+        remove(validators_file)
+        if os.path.isdir(directory) and not os.listdir(directory):
+            os.rmdir(directory)
+
+
 def remove(path):
     if os.path.exists(path):
         os.remove(path)
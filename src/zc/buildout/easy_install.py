@@ -18,9 +18,11 @@ It doesn't install scripts.  It uses setuptools and requires it to be
 installed.
 """
 
+import collections
 import distutils.errors
 import errno
 import glob
+import json
 import logging
 import os
 import pkg_resources
@@ -34,7 +36,10 @@ import shutil
 import subprocess
 import sys
 import tempfile
+import threading
 import zc.buildout
+import zc.buildout.context
+import zc.buildout.replace
 import zc.buildout.rmtree
 import warnings
 
@@ -159,8 +164,15 @@ if is_win32:
 else:
     _safe_arg = str
 
+def _subprocess_options(kw):
+    # Run in the directory and environment of the current recipe, if any.
+    context = zc.buildout.context.current()
+    if context is not None:
+        context.subprocess_options(kw)
+    return kw
+
 def call_subprocess(args, **kw):
-    if subprocess.call(args, **kw) != 0:
+    if subprocess.call(args, **_subprocess_options(kw)) != 0:
         raise Exception(
             "Failed to run command:\n%s"
             % repr(args)[1:-1])
@@ -222,6 +234,68 @@ def dist_needs_pkg_resources(dist):
     )
 
 
+class _Environment(pkg_resources.Environment):
+    """An environment that only scans eggs when they're looked up
+
+    Eggs' file names start with their project names, so they're grouped
+    by project and only scanned when their project is looked up, which,
+    for big eggs directories, is only done for a few of them.  Other
+    locations are scanned right away.
+
+    Distributions found in ``dest`` are seen as eggs, even if they're
+    some other kind of distribution.
+    """
+
+    def __init__(self, search_path, dest):
+        self._dest = dest
+        self._unscanned = {}
+        pkg_resources.Environment.__init__(self, search_path)
+
+    def scan(self, search_path=None):
+        if search_path is None:
+            search_path = sys.path
+        scan = []
+        for location in search_path:
+            name, ext = os.path.splitext(os.path.basename(location))
+            match = ext.lower() == '.egg' and pkg_resources.EGG_NAME(name)
+            if match:
+                key = pkg_resources.safe_name(match.group('name')).lower()
+                self._unscanned.setdefault(key, []).append(location)
+            else:
+                scan.append(location)
+        self._scan(scan)
+
+    def _scan(self, search_path):
+        dists = []
+        for location in search_path:
+            for dist in pkg_resources.find_distributions(location):
+                self.add(dist)
+                dists.append(dist)
+        for dist in dists:
+            if os.path.dirname(dist.location) == self._dest:
+                dist.precedence = pkg_resources.EGG_DIST
+
+    def __getitem__(self, project_name):
+        locations = self._unscanned.pop(project_name.lower(), None)
+        if locations:
+            self._scan(locations)
+        return pkg_resources.Environment.__getitem__(self, project_name)
+
+    def __iter__(self):
+        for key in list(self._unscanned):
+            self[key]
+        return pkg_resources.Environment.__iter__(self)
+
+
+_can_add = pkg_resources.Environment([]).can_add
+
+def _find_distributions(location):
+    # Return the distributions at a location that an environment of
+    # the location would have.
+    return [dist for dist in pkg_resources.find_distributions(location)
+            if _can_add(dist)]
+
+
 class Installer(object):
 
     _versions = {}
@@ -229,6 +303,7 @@ class Installer(object):
     _picked_versions = {}
     _download_cache = None
     _install_from_cache = False
+    _use_eggs_directory_index = False
     _prefer_final = True
     _use_dependency_links = True
     _allow_picked_versions = True
@@ -283,35 +358,24 @@ class Installer(object):
 
     def _make_env(self):
         full_path = self._get_dest_dist_paths() + self._path
-        env = pkg_resources.Environment(full_path)
-        # this needs to be called whenever self._env is modified (or we could
-        # make an Environment subclass):
-        self._eggify_env_dest_dists(env, self._dest)
-        return env
-
-    def _env_rescan_dest(self):
-        self._env.scan(self._get_dest_dist_paths())
-        self._eggify_env_dest_dists(self._env, self._dest)
+        return _Environment(full_path, self._dest)
+
+    def _env_rescan_dest(self, locations):
+        # Add distributions that were added to the destination.  Unless
+        # it's indexed, the whole destination is scanned again, as other
+        # processes may have added distributions to it too.
+        if self._use_eggs_directory_index:
+            self._env.scan(locations)
+        else:
+            self._env.scan(self._get_dest_dist_paths())
 
     def _get_dest_dist_paths(self):
         dest = self._dest
         if dest is None:
             return []
-        eggs = glob.glob(os.path.join(dest, '*.egg'))
-        dists = [os.path.dirname(dist_info) for dist_info in
-                 glob.glob(os.path.join(dest, '*', '*.dist-info'))]
-        return list(set(eggs + dists))
-
-    @staticmethod
-    def _eggify_env_dest_dists(env, dest):
-        """
-        Make sure everything found under `dest` is seen as an egg, even if it's
-        some other kind of dist.
-        """
-        for project_name in env:
-            for dist in env[project_name]:
-                if os.path.dirname(dist.location) == dest:
-                    dist.precedence = pkg_resources.EGG_DIST
+        if self._use_eggs_directory_index:
+            return _eggs_directory_index(dest).paths()
+        return _scan_eggs_directory(dest)
 
     def _version_conflict_information(self, name):
         """Return textual requirements/constraint information for debug purposes
@@ -423,9 +487,8 @@ class Installer(object):
             paths = call_easy_install(spec, tmp)
 
             dists = []
-            env = pkg_resources.Environment(paths)
-            for project in env:
-                dists.extend(env[project])
+            for path in paths:
+                dists.extend(_find_distributions(path))
 
             if not dists:
                 raise zc.buildout.UserError("Couldn't install: %s" % dist)
@@ -580,7 +643,7 @@ class Installer(object):
                 if tmp != self._download_cache:
                     zc.buildout.rmtree.rmtree(tmp)
 
-            self._env_rescan_dest()
+            self._env_rescan_dest([_d.location for _d in dists])
             dist = self._env.best_match(requirement, ws)
 
             logger.info("Got %s.", dist)
@@ -689,9 +752,13 @@ class Installer(object):
         # because we have to constrain our requirements (see
         # versions_section_ignored_for_dependency_in_favor_of_site_packages in
         # zc.buildout.tests).
-        requirements.reverse() # Set up the stack.
+        requirements = collections.deque(reversed(requirements))
         processed = {}  # This is a set of processed requirements.
         best = {}  # This is a mapping of package name -> dist.
+        # Requirements often occur many times, so they're constrained
+        # once, and the requirements of distributions are looked up once.
+        constrained = {}
+        requires = {}
         # Note that we don't use the existing environment, because we want
         # to look for new eggs unless what we have is the best that
         # matches the requirement.
@@ -699,8 +766,11 @@ class Installer(object):
 
         while requirements:
             # Process dependencies breadth-first.
-            current_requirement = requirements.pop(0)
-            req = self._constrain(current_requirement)
+            current_requirement = requirements.popleft()
+            req = constrained.get(current_requirement)
+            if req is None:
+                req = constrained[current_requirement] = self._constrain(
+                    current_requirement)
             if req in processed:
                 # Ignore cyclic or redundant dependencies.
                 continue
@@ -762,7 +832,11 @@ class Installer(object):
                     set(dist.extras) & set(req.extras)
                 )
             else:
-                extra_requirements = dist.requires(req.extras)[::-1]
+                key = dist, req.extras
+                extra_requirements = requires.get(key)
+                if extra_requirements is None:
+                    extra_requirements = requires[key] = dist.requires(
+                        req.extras)[::-1]
 
             for extra_requirement in extra_requirements:
                 self._requirements_and_constraints.append(
@@ -903,6 +977,12 @@ def install_from_cache(setting=None):
         Installer._install_from_cache = bool(setting)
     return old
 
+def eggs_directory_index(setting=None):
+    old = Installer._use_eggs_directory_index
+    if setting is not None:
+        Installer._use_eggs_directory_index = bool(setting)
+    return old
+
 def prefer_final(setting=None):
     old = Installer._prefer_final
     if setting is not None:
@@ -1049,6 +1129,10 @@ def develop(setup, dest,
             build_ext=None,
             executable=sys.executable):
     assert executable == sys.executable, (executable, sys.executable)
+    context = zc.buildout.context.current()
+    if context is not None:
+        setup = context.path(setup)
+        dest = context.path(dest)
     if os.path.isdir(setup):
         directory = setup
         setup = os.path.join(directory, 'setup.py')
@@ -1650,7 +1734,7 @@ def call_easy_install(spec, dest):
 
     sys.stdout.flush() # We want any pending output first
 
-    exit_code = subprocess.call(list(args))
+    exit_code = subprocess.call(list(args), **_subprocess_options({}))
 
     if exit_code:
         logger.error(
@@ -1699,8 +1783,7 @@ def _get_matching_dist_in_location(dist, location):
     # may be normalized (e.g., 3.3 becomes 3.3.0 when downloaded from
     # PyPI.)
 
-    env = pkg_resources.Environment([location])
-    dists = [ d for project_name in env for d in env[project_name] ]
+    dists = _find_distributions(location)
     dist_infos = [ (d.project_name.lower(), d.parsed_version) for d in dists ]
     if dist_infos == [(dist.project_name.lower(), dist.parsed_version)]:
         return dists.pop()
@@ -1777,4 +1860,115 @@ def _move_to_eggs_dir_and_compile(dist, dest):
     finally:
         # Remember that temporary directories must be removed
         zc.buildout.rmtree.rmtree(tmp_dest)
+    index = _eggs_directory_indexes.get(dest)
+    if index is not None:
+        index.add(newloc)
     return newdist
+
+
+def _scan_eggs_directory(dest):
+    # Return the locations of the distributions in an eggs directory.
+    eggs = glob.glob(os.path.join(dest, '*.egg'))
+    dists = [os.path.dirname(dist_info) for dist_info in
+             glob.glob(os.path.join(dest, '*', '*.dist-info'))]
+    return list(set(eggs + dists))
+
+
+class EggsDirectoryIndex(object):
+    """The distributions in an eggs directory, kept in a file in it
+
+    Finding the distributions means looking into every subdirectory of
+    the eggs directory, which takes long for big shared eggs
+    directories.  The index is used as long as the modification time of
+    the directory, which changes when entries are added or removed, is
+    the one recorded with it.  Distributions added by buildout are
+    added to the index, without scanning the directory again.
+
+    The index is kept in a hidden subdirectory, so writing it doesn't
+    change the modification time of the eggs directory.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, '.buildout-index', 'eggs.json')
+        self._lock = threading.Lock()
+        self._data = None
+
+    def paths(self):
+        """Return the locations of the distributions
+        """
+        with self._lock:
+            if self._data is None:
+                try:
+                    with open(self.path) as f:
+                        self._data = json.load(f)
+                except (IOError, OSError, ValueError):
+                    self._data = {}
+            if self._data.get('mtime') != _mtime(self.directory):
+                self._scan()
+            return [os.path.join(self.directory, name)
+                    for names in self._data['projects'].values()
+                    for name in names]
+
+    def add(self, location):
+        """Add the location of a distribution added to the directory
+        """
+        with self._lock:
+            if self._data is None or 'projects' not in self._data:
+                return
+            # The directory should have one more entry than when the
+            # index was saved, otherwise something else changed it.
+            if len(os.listdir(self.directory)) != self._data['entries'] + 1:
+                self._scan()
+                return
+            name = os.path.basename(location)
+            names = self._data['projects'].setdefault(_project_key(name), [])
+            if name not in names:
+                names.append(name)
+            self._save()
+
+    def _scan(self):
+        projects = {}
+        for location in _scan_eggs_directory(self.directory):
+            name = os.path.basename(location)
+            projects.setdefault(_project_key(name), []).append(name)
+        for names in projects.values():
+            names.sort()
+        self._data = dict(projects=projects)
+        self._save()
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        try:
+            if not os.path.isdir(directory):
+                os.mkdir(directory)
+            self._data['mtime'] = _mtime(self.directory)
+            self._data['entries'] = len(os.listdir(self.directory))
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self._data, f, sort_keys=True)
+            zc.buildout.replace.replace(tmp, self.path)
+        except (IOError, OSError):
+            # The index can't be written, for example because the
+            # directory is shared and read-only.  It's still used for
+            # this run.
+            logger.debug("Couldn't save the index of %s.", self.directory)
+
+
+_eggs_directory_indexes = {}
+_eggs_directory_indexes_lock = threading.Lock()
+
+def _eggs_directory_index(dest):
+    with _eggs_directory_indexes_lock:
+        index = _eggs_directory_indexes.get(dest)
+        if index is None:
+            index = _eggs_directory_indexes[dest] = EggsDirectoryIndex(dest)
+        return index
+
+def _mtime(path):
+    st = os.stat(path)
+    return getattr(st, 'st_mtime_ns', st.st_mtime)
+
+def _project_key(name):
+    # Return the key of the project of a distribution location's name.
+    return pkg_resources.safe_name(name.split('-', 1)[0]).lower()
@@ -0,0 +1,196 @@
+##############################################################################
+#
+# Copyright Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""What's installed: an SQLite database for it, and checks of installed files
+
+The installed file, ``.installed.cfg`` by default, is rewritten as a
+whole whenever a part is installed.  A database stores every section
+in its own row instead, so saving a part takes the same time however
+many parts there are.
+"""
+
+import hashlib
+import json
+import os
+import stat
+import threading
+
+import zc.buildout
+
+
+class Database(object):
+    """Installed sections, with their options, kept in an SQLite database
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _connect(self):
+        if self._connection is None:
+            try:
+                import sqlite3
+            except ImportError:
+                raise zc.buildout.UserError(
+                    "The installed-database option requires Python's"
+                    " sqlite3 module.")
+            # Parts may be saved by other threads than the one that
+            # read them (see the jobs option), but never at the same
+            # time.
+            self._connection = sqlite3.connect(
+                self.path, check_same_thread=False)
+            self._connection.execute(
+                "create table if not exists sections"
+                " (name text primary key, options text not null)")
+        return self._connection
+
+    def read(self):
+        """Return a dictionary of the options of all sections
+        """
+        return dict(
+            (name, json.loads(options))
+            for name, options in self._connect().execute(
+                "select name, options from sections"))
+
+    def save(self, sections):
+        """Store the options of some sections, leaving the others alone
+        """
+        connection = self._connect()
+        with connection:
+            _save(connection, sections)
+
+    def update(self, section, **options):
+        """Change some options of a section
+        """
+        connection = self._connect()
+        with connection:
+            row = connection.execute(
+                "select options from sections where name = ?",
+                (section, )).fetchone()
+            data = row and json.loads(row[0]) or {}
+            data.update(options)
+            _save(connection, {section: data})
+
+    def delete(self, names):
+        """Remove some sections
+        """
+        connection = self._connect()
+        with connection:
+            connection.executemany(
+                "delete from sections where name = ?",
+                [(name, ) for name in names])
+
+    def write(self, sections):
+        """Replace all sections
+        """
+        connection = self._connect()
+        with connection:
+            connection.execute("delete from sections")
+            _save(connection, sections)
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def remove(self):
+        self.close()
+        if self.exists():
+            os.remove(self.path)
+
+
+def _save(connection, sections):
+    connection.executemany(
+        "insert or replace into sections (name, options) values (?, ?)",
+        [(name, json.dumps(dict(options), sort_keys=True))
+         for name, options in sections.items()])
+
+
+def fingerprint(path, content=False):
+    """Return a string describing the state of an installed file
+
+    It has the file's size and modification time and, if content is
+    true, a hash of its content.  Directories, whose content often
+    changes when what's installed is used, get an empty string, so only
+    their existence is checked.  None is returned if the path doesn't
+    exist.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if stat.S_ISDIR(st.st_mode):
+        return ''
+    result = '%d %r' % (st.st_size, st.st_mtime)
+    if content:
+        result += ' ' + _content_hash(path)
+    return result
+
+def unchanged(path, recorded):
+    """Tell whether an installed path still has a recorded fingerprint
+
+    If the fingerprint has a content hash, the file's content is
+    compared rather than its modification time.  For an empty
+    fingerprint, only the path's existence is checked.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    if not recorded:
+        return True
+    if stat.S_ISDIR(st.st_mode):
+        return False
+    fields = recorded.split()
+    if int(fields[0]) != st.st_size:
+        return False
+    if len(fields) > 2:
+        return fields[2] == _content_hash(path)
+    return fields[1] == repr(st.st_mtime)
+
+def all_unchanged(paths, recorded, jobs=4):
+    """Tell whether none of the installed paths changed
+
+    The paths are checked by up to the given number of threads.
+    """
+    items = list(zip(paths, recorded))
+    jobs = min(jobs, len(items) // 100 + 1)
+    if jobs <= 1:
+        return _all_unchanged(items)
+    results = []
+    threads = [
+        threading.Thread(target=lambda chunk: results.append(
+            _all_unchanged(chunk)), args=(items[i::jobs], ))
+        for i in range(jobs)
+        ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return all(results)
+
+def _all_unchanged(items):
+    for path, recorded in items:
+        if not unchanged(path, recorded):
+            return False
+    return True
+
+def _content_hash(path):
+    hash = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(1 << 16), b''):
+            hash.update(data)
+    return hash.hexdigest()
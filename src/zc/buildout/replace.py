@@ -0,0 +1,58 @@
+##############################################################################
+#
+# Copyright (c) 2006 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+
+
+import doctest
+import os
+
+def replace(src, dst):
+    """
+    Rename a file over another one, replacing it if it exists.
+
+    Where the platform allows it, the destination is replaced atomically,
+    so it's either the old file or the new one, even if we're
+    interrupted.
+
+    >>> from tempfile import mkdtemp
+    >>> d = mkdtemp()
+    >>> src = os.path.join(d, 'src')
+    >>> dst = os.path.join(d, 'dst')
+    >>> for path, data in ((src, 'new'), (dst, 'old')):
+    ...     with open(path, 'w') as f:
+    ...         _ = f.write(data)
+    >>> replace(src, dst)
+    >>> sorted(os.listdir(d))
+    ['dst']
+    >>> with open(dst) as f:
+    ...     print(f.read())
+    new
+    >>> os.remove(dst)
+    >>> os.rmdir(d)
+    """
+    try:
+        os.replace(src, dst)
+    except AttributeError:
+        # Python 2
+        try:
+            os.rename(src, dst)
+        except OSError:
+            # Windows won't rename over an existing file.
+            os.remove(dst)
+            os.rename(src, dst)
+
+def test_suite():
+    return doctest.DocTestSuite()
+
+if "__main__" == __name__:
+    doctest.testmod()
@@ -24,6 +24,7 @@ except ImportError:
     from urllib2        import urlopen
 
 import errno
+import hashlib
 import logging
 from multiprocessing import Process
 import os
@@ -390,6 +391,7 @@ class Server(HTTPServer):
 class Handler(BaseHTTPRequestHandler):
 
     Server.__log = False
+    Server.__etags = False
 
     def __init__(self, request, address, server):
         self.__server = server
@@ -417,6 +419,14 @@ class Handler(BaseHTTPRequestHandler):
             self.__server.__log = False
             return k()
 
+        if self.path == '/enable_etags':
+            self.__server.__etags = True
+            return k()
+
+        if self.path == '/disable_etags':
+            self.__server.__etags = False
+            return k()
+
         path = os.path.abspath(os.path.join(self.tree, *self.path.split('/')))
         if not (
             ((path == self.tree) or path.startswith(self.tree+os.path.sep))
@@ -433,7 +443,19 @@ class Handler(BaseHTTPRequestHandler):
             self.wfile.write(out)
             return
 
+        if os.path.isfile(path) and self.__server.__etags:
+            with open(path, 'rb') as f:
+                etag = '"%s"' % hashlib.md5(f.read()).hexdigest()
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+        else:
+            etag = None
+
         self.send_response(200)
+        if etag:
+            self.send_header('ETag', etag)
         if os.path.isdir(path):
             out = ['<html><body>\n']
             names = sorted(os.listdir(path))
@@ -2,6 +2,10 @@ from zc.buildout.buildout import print_
 
 class Debug:
 
+    # Debug doesn't use the working directory, so it can be installed
+    # at the same time as other parts.
+    uses_context = True
+
     def __init__(self, buildout, name, options):
         self.buildout = buildout
         self.name = name
@@ -30,6 +30,7 @@ import sys
 import tempfile
 import unittest
 import zc.buildout.easy_install
+import zc.buildout.replace
 import zc.buildout.testing
 import zipfile
 
@@ -1523,6 +1524,7 @@ uninstall
     [buildout]
     ...
     [foo]
+    __buildout_fingerprint__ = ...
     __buildout_installed__ = a
     	b
     	c
@@ -3258,6 +3260,1716 @@ def test_buildout_doesnt_keep_adding_itself_to_versions():
     True
     """
 
+def config_cache_reuses_parsed_configuration():
+    r"""
+    When a config-cache is given, the result of reading the configuration
+    is cached and reused as long as none of the files changed.
+
+    >>> write('base.cfg', '''
+    ... [buildout]
+    ... parts = p
+    ... [p]
+    ... recipe = zc.buildout:debug
+    ... x = 1
+    ... ''')
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... extends = base.cfg
+    ... [p]
+    ... x += 2
+    ... ''')
+
+    >>> print_(system(buildout+' config-cache=cfg-cache'), end='')
+    Installing p.
+      recipe='zc.buildout:debug'
+      x='1\n2'
+    >>> len(os.listdir('cfg-cache'))
+    1
+    >>> print_(system(buildout+' config-cache=cfg-cache'), end='')
+    Updating p.
+      recipe='zc.buildout:debug'
+      x='1\n2'
+
+    Changing any of the files invalidates the cached result:
+
+    >>> write('base.cfg', '''
+    ... [buildout]
+    ... parts = p
+    ... [p]
+    ... recipe = zc.buildout:debug
+    ... x = 3
+    ... ''')
+    >>> print_(system(buildout+' config-cache=cfg-cache'), end='')
+    Uninstalling p.
+    Installing p.
+      recipe='zc.buildout:debug'
+      x='3\n2'
+    >>> len(os.listdir('cfg-cache'))
+    1
+    """
+
+def remote_extends_are_downloaded_concurrently():
+    r"""
+    Remote configuration files are downloaded by up to extends-jobs
+    worker threads, but they are still merged in the usual depth-first
+    order:
+
+    >>> server_data = tmpdir('server_data')
+    >>> server_url = start_server(server_data)
+    >>> write(server_data, 'a.cfg', '''
+    ... [buildout]
+    ... extends = c.cfg
+    ... x = a
+    ... ''')
+    >>> write(server_data, 'b.cfg', '''
+    ... [buildout]
+    ... x = b
+    ... y = b
+    ... ''')
+    >>> write(server_data, 'c.cfg', '''
+    ... [buildout]
+    ... x = c
+    ... y = c
+    ... z = c
+    ... ''')
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... extends = %(url)sa.cfg %(url)sb.cfg
+    ... parts = p
+    ... extends-jobs = 3
+    ...
+    ... [p]
+    ... recipe = zc.buildout:debug
+    ... v = ${buildout:x} ${buildout:y} ${buildout:z}
+    ... ''' % dict(url=server_url))
+
+    >>> print_(system(buildout), end='')
+    Installing p.
+      recipe='zc.buildout:debug'
+      v='b b c'
+
+    The same happens with a single job, which downloads the files one
+    at a time:
+
+    >>> print_(system(buildout+' extends-jobs=1'), end='')
+    Updating p.
+      recipe='zc.buildout:debug'
+      v='b b c'
+
+    Downloading errors are reported as usual:
+
+    >>> remove(server_data, 'c.cfg')
+    >>> print_(system(buildout), end='') # doctest: +ELLIPSIS
+    While:
+      Initializing.
+    Error: Error downloading extends for URL http://localhost:.../c.cfg: ...
+
+    Errors are raised with the traceback of the thread that downloaded the
+    file:
+
+    >>> import traceback
+    >>> from zc.buildout.buildout import _ExtendsPrefetcher
+    >>> def download(url):
+    ...     raise ValueError(url)
+    >>> prefetcher = _ExtendsPrefetcher(download, 2)
+    >>> try:
+    ...     prefetcher.get('http://example.com/a.cfg')
+    ... except ValueError:
+    ...     print_(traceback.format_exc().split('\n')[-3:-1])
+    ['    raise ValueError(url)', 'ValueError: http://example.com/a.cfg']
+
+    Once the prefetcher is closed, no more downloads are started:
+
+    >>> prefetcher.close()
+    >>> prefetcher.prefetch('http://example.com', ['b.cfg'])
+    >>> prefetcher.get('http://example.com/b.cfg')
+    Traceback (most recent call last):
+    ...
+    ValueError: ('The prefetcher is closed', 'http://example.com/b.cfg')
+    >>> [t for t in prefetcher._threads if t.is_alive()]
+    []
+    """
+
+def update_section_does_not_change_the_second_section():
+    """
+    Merging a section into another one changes only the first one, but
+    the values of the second one aren't copied unless they have to be.
+
+    >>> from zc.buildout.buildout import SectionKey, _update_section
+    >>> s1 = {'x': SectionKey('1', 'base.cfg')}
+    >>> s2 = {'x +': SectionKey('2', 'buildout.cfg'),
+    ...       'y': SectionKey('3', 'buildout.cfg')}
+    >>> _update_section(s1, s2) is s1
+    True
+    >>> for key in sorted(s1): # doctest: +NORMALIZE_WHITESPACE
+    ...     print_(key, s1[key].history)
+    x [<HistoryItem operation=SET value=1 source=base.cfg>,
+       <HistoryItem operation=ADD value=2 source=buildout.cfg>]
+    y [<HistoryItem operation=SET value=3 source=buildout.cfg>]
+
+    >>> for key in sorted(s2):
+    ...     print_(key, s2[key].history)
+    x + [<HistoryItem operation=SET value=2 source=buildout.cfg>]
+    y [<HistoryItem operation=SET value=3 source=buildout.cfg>]
+
+    Changing the result doesn't change the second section either:
+
+    >>> s1['y'].addToValue('4', 'more.cfg')
+    >>> s1['y']
+    <SectionKey value=3 4 source=more.cfg>
+    >>> s2['y']
+    <SectionKey value=3 source=buildout.cfg>
+    """
+
+def substitutions_are_parsed_once():
+    r"""
+    Option values are split into literal text and substitutions only once
+    per buildout:
+
+    >>> from zc.buildout.buildout import _parse_substitutions
+    >>> parsed = {}
+    >>> tokens = _parse_substitutions('a ${x:y}$${z:z} ${:w}${x:y:z}', parsed)
+    >>> for token in tokens:
+    ...     print_(repr(token))
+    'a '
+    ('x', 'y', None)
+    '$$'
+    '{z:z} '
+    ('', 'w', None)
+    (None, None, 'The substitution, ${x:y:z},\nhas too many colons.')
+    >>> _parse_substitutions('a ${x:y}$${z:z} ${:w}${x:y:z}', parsed) is tokens
+    True
+    >>> list(parsed) == ['a ${x:y}$${z:z} ${:w}${x:y:z}']
+    True
+
+    Each buildout keeps the values it parsed, which go away with it:
+
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... parts =
+    ... x = ${buildout:directory}/x
+    ... ''')
+    >>> b = zc.buildout.buildout.Buildout('buildout.cfg', [])
+    >>> '${buildout:directory}/x' in b._parsed_substitutions
+    True
+
+    Invalid substitutions are only reported when they are used, after
+    the ones before them:
+
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... parts =
+    ... x = ${buildout:missing} ${bad}
+    ... ''')
+    >>> print_(system(buildout), end='')
+    While:
+      Initializing.
+      Getting section buildout.
+      Initializing section buildout.
+      Getting option buildout:x.
+    Error: Referenced option does not exist: buildout missing
+    """
+
+def dependency_graph_of_sections():
+    r"""
+    Buildout records which sections refer to which other ones in
+    substitutions, and the part dependencies given with ``=>``:
+
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... parts = b a
+    ...
+    ... [settings]
+    ... x = 1
+    ...
+    ... [a]
+    ... recipe = zc.buildout:debug
+    ... => c
+    ... x = ${settings:x} ${:y}
+    ... y = 2
+    ...
+    ... [b]
+    ... recipe = zc.buildout:debug
+    ... x = ${a:x}
+    ...
+    ... [c]
+    ... recipe = zc.buildout:debug
+    ... ''')
+
+    >>> b = zc.buildout.buildout.Buildout('buildout.cfg', [])
+    >>> for part in b['buildout']['parts'].split():
+    ...     _ = b[part]
+    >>> graph = b.dependency_graph
+    >>> graph.sections()
+    ['a', 'b', 'buildout', 'c', 'settings', 'versions']
+    >>> graph.dependencies('a')
+    ['settings', 'c']
+    >>> graph.dependents('a')
+    ['b']
+
+    The graph command shows the graph of the configured parts in the
+    Graphviz dot format, or as JSON:
+
+    >>> print_(system(buildout+' graph'), end='')
+    digraph buildout {
+      "a";
+      "a" -> "settings";
+      "a" -> "c";
+      "b";
+      "b" -> "a";
+      "buildout";
+      "c";
+      "settings";
+      "versions";
+    }
+
+    >>> print_(system(buildout+' graph json'), end='')
+    {
+      "a": [
+        "settings",
+        "c"
+      ],
+      "b": [
+        "a"
+      ],
+      "buildout": [],
+      "c": [],
+      "settings": [],
+      "versions": []
+    }
+
+    >>> print_(system(buildout+' graph svg'), end='')
+    Error: The graph command takes dot or json as its only argument.
+
+    Nothing is installed to show the graph.  Recipes that aren't
+    installed yet, like recipes from develop eggs, are only available
+    after running buildout:
+
+    >>> mkdir('recipes')
+    >>> write('recipes', 'debug.py', '''
+    ... class Debug:
+    ...     def __init__(self, buildout, name, options):
+    ...         options['x']
+    ...     def install(self):
+    ...         return ()
+    ... ''')
+    >>> write('recipes', 'setup.py', '''
+    ... from setuptools import setup
+    ... setup(name="recipes", py_modules=['debug'],
+    ...       entry_points={'zc.buildout': ['default = debug:Debug']})
+    ... ''')
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... develop = recipes
+    ... parts = a
+    ...
+    ... [a]
+    ... recipe = recipes
+    ... x = ${b:x}
+    ...
+    ... [b]
+    ... x = 1
+    ... ''')
+    >>> print_(system(buildout+' graph json'), end='')
+    While:
+      Computing dependencies.
+    Error: The recipes recipe of the a part isn't installed.
+    Run buildout install to install it, or to make the develop egg it comes from.
+    >>> ls('develop-eggs')
+    -  zc.recipe.egg.egg-link
+
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipes'
+    Installing a.
+    >>> with open('.installed.cfg') as f:
+    ...     installed = f.read()
+    >>> print_(system(buildout+' graph json'), end='')
+    {
+      "a": [
+        "b"
+      ],
+      "b": [],
+      "buildout": [],
+      "versions": []
+    }
+    >>> with open('.installed.cfg') as f:
+    ...     f.read() == installed
+    True
+    """
+
+def parts_are_installed_concurrently_with_jobs():
+    r"""
+    With the jobs option, up to that many parts are installed at the same
+    time.  Parts wait for the parts before them they depend on, as found in
+    substitutions and part dependencies:
+
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... parts = a b c
+    ... jobs = 2
+    ...
+    ... [a]
+    ... recipe = zc.buildout:debug
+    ...
+    ... [b]
+    ... recipe = zc.buildout:debug
+    ...
+    ... [c]
+    ... recipe = zc.buildout:debug
+    ... => a
+    ... ''')
+
+    >>> b = zc.buildout.buildout.Buildout('buildout.cfg', [])
+    >>> b.jobs
+    2
+    >>> for part in b['buildout']['parts'].split():
+    ...     _ = b[part]
+    >>> dependencies = b._part_dependencies(['a', 'b', 'c'])
+    >>> for part in sorted(dependencies):
+    ...     print_(part, sorted(dependencies[part]))
+    a []
+    b []
+    c ['a']
+
+    Let's replace the installation of a single part to see what happens:
+
+    >>> import threading
+    >>> events = []
+    >>> b_started = threading.Event()
+    >>> def install_part(part, installation):
+    ...     events.append('start ' + part)
+    ...     if part == 'b':
+    ...         b_started.set()
+    ...     if part == 'a':
+    ...         # b is installed while a is being installed:
+    ...         events.append('b started: %s' % b_started.wait(10))
+    ...     events.append('end ' + part)
+    >>> b._install_part = install_part
+    >>> b._install_parts_concurrently(['a', 'b', 'c'], None)
+    >>> 'b started: True' in events
+    True
+    >>> events.index('start c') > events.index('end a')
+    True
+
+    When a part fails, no new parts are started, but the ones being
+    installed are finished.  Then the error is raised:
+
+    >>> del events[:]
+    >>> def install_part(part, installation):
+    ...     events.append(part)
+    ...     if part == 'a':
+    ...         raise ValueError('a failed')
+    >>> b._install_part = install_part
+    >>> b._install_parts_concurrently(['a', 'b', 'c'], None)
+    Traceback (most recent call last):
+    ...
+    ValueError: a failed
+    >>> sorted(events)
+    ['a', 'b']
+
+    The error is raised with the traceback of the thread that installed
+    the part, once all of the threads are done:
+
+    >>> import sys, traceback
+    >>> threads = threading.active_count()
+    >>> try:
+    ...     b._install_parts_concurrently(['a', 'b', 'c'], None)
+    ... except ValueError:
+    ...     print_(traceback.extract_tb(sys.exc_info()[2])[-1][2])
+    install_part
+    >>> threading.active_count() == threads
+    True
+
+    Installing parts for real records them in .installed.cfg as usual.
+    (These parts depend on each other, so the output is predictable.)
+
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... parts = a b
+    ... jobs = 2
+    ...
+    ... [a]
+    ... recipe = zc.buildout:debug
+    ...
+    ... [b]
+    ... recipe = zc.buildout:debug
+    ... x = ${a:recipe}
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Installing a.
+      recipe='zc.buildout:debug'
+    Installing b.
+      recipe='zc.buildout:debug'
+      x='zc.buildout:debug'
+    >>> print_(system(buildout+' jobs=3'), end='')
+    Updating a.
+      recipe='zc.buildout:debug'
+    Updating b.
+      recipe='zc.buildout:debug'
+      x='zc.buildout:debug'
+    >>> import zc.buildout.configparser
+    >>> with open('.installed.cfg') as f:
+    ...     print_(zc.buildout.configparser.parse(f, 'f')['buildout']['parts'])
+    a b
+
+    >>> print_(system(buildout+' jobs=x'), end='')
+    While:
+      Initializing.
+    Error: Invalid value for 'jobs' option: 'x'
+
+    Installed parts are recorded in the order they're configured in, after
+    the installed parts that aren't being installed, whatever order they're
+    installed in:
+
+    >>> installation = zc.buildout.buildout._Installation(
+    ...     {}, ['x', 'b'], True, ['a', 'b', 'c'])
+    >>> installation.add('c')
+    >>> installation.parts
+    ['x', 'b', 'c']
+    >>> installation.add('a')
+    >>> installation.parts
+    ['x', 'a', 'b', 'c']
+    """
+
+def recipes_changing_the_working_directory_are_installed_one_at_a_time():
+    r"""
+    Recipes that don't use their context may change the working directory
+    of the buildout process, or use files relative to it.  Even with the
+    jobs option, they're installed one at a time:
+
+    >>> mkdir('recipes')
+    >>> write('recipes', 'cwd.py', '''
+    ... import os, time
+    ... class Recipe:
+    ...     def __init__(self, buildout, name, options):
+    ...         self.name, self.options = name, options
+    ...     def install(self):
+    ...         os.mkdir(self.name)
+    ...         os.chdir(self.name)
+    ...         time.sleep(float(self.options['sleep']))
+    ...         with open('name', 'w') as f:
+    ...             f.write(self.name)
+    ...         return self.name
+    ... ''')
+    >>> write('recipes', 'setup.py', '''
+    ... from setuptools import setup
+    ... setup(name="recipes", py_modules=['cwd'],
+    ...       entry_points={'zc.buildout': ['default = cwd:Recipe']})
+    ... ''')
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... develop = recipes
+    ... parts = a b
+    ... jobs = 2
+    ...
+    ... [a]
+    ... recipe = recipes
+    ... sleep = 0.5
+    ...
+    ... [b]
+    ... recipe = recipes
+    ... sleep = 0
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipes'
+    Installing a.
+    Installing b.
+    >>> cat('a', 'name')
+    a
+    >>> cat('b', 'name')
+    b
+    """
+
+def recipes_run_commands_in_their_context():
+    r"""
+    The options of each section have an execution context, with a working
+    directory and environment variables added to os.environ:
+
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... parts = a
+    ...
+    ... [a]
+    ... recipe = zc.buildout:debug
+    ... ''')
+    >>> b = zc.buildout.buildout.Buildout('buildout.cfg', [])
+    >>> context = b['a'].context
+    >>> context
+    Context('/sample-buildout', {})
+    >>> context = context.extend({'TEST_CONTEXT': 'a'}, 'parts')
+    >>> context
+    Context('/sample-buildout/parts', {'TEST_CONTEXT': 'a'})
+    >>> context.environ()['TEST_CONTEXT']
+    'a'
+    >>> 'TEST_CONTEXT' in os.environ
+    False
+
+    While a recipe is called, its context is the current one, which
+    call_subprocess and develop use:
+
+    >>> import zc.buildout.context
+    >>> print_(zc.buildout.context.current())
+    None
+    >>> def install():
+    ...     previous = zc.buildout.context.activate(context)
+    ...     try:
+    ...         zc.buildout.easy_install.call_subprocess([sys.executable, '-c',
+    ...             'import os; open("out", "w").write(os.environ["TEST_CONTEXT"])'
+    ...             ])
+    ...     finally:
+    ...         zc.buildout.context.activate(previous)
+    ...     return zc.buildout.context.current()
+    >>> b['a']._call(install)
+    Context('/sample-buildout', {})
+    >>> cat('parts', 'out')
+    a
+    >>> print_(zc.buildout.context.current())
+    None
+    >>> os.getcwd() == sample_buildout
+    True
+    """
+
+def installed_parts_can_be_kept_in_a_database():
+    r"""
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... parts = a
+    ...
+    ... [a]
+    ... recipe = zc.buildout:debug
+    ... x = 1
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Installing a.
+      recipe='zc.buildout:debug'
+      x='1'
+
+    With the installed-database option, what's installed is kept in an
+    SQLite database.  The installed file is imported into it first:
+
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... parts = a b
+    ... installed-database = .installed.db
+    ...
+    ... [a]
+    ... recipe = zc.buildout:debug
+    ... x = 1
+    ...
+    ... [b]
+    ... recipe = zc.buildout:debug
+    ... x = ${a:x}
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Updating a.
+      recipe='zc.buildout:debug'
+      x='1'
+    Installing b.
+      recipe='zc.buildout:debug'
+      x='1'
+    >>> os.path.exists('.installed.cfg'), os.path.exists('.installed.db')
+    (False, True)
+
+    The installed command shows what's installed in the format of the
+    installed file:
+
+    >>> print_(system(buildout+' installed'), end='')
+    ... # doctest: +NORMALIZE_WHITESPACE +ELLIPSIS
+    [buildout]
+    installed_develop_eggs =
+    parts = a b
+    <BLANKLINE>
+    [a]
+    __buildout_fingerprint__ = ...
+    __buildout_installed__ =
+    __buildout_signature__ = zc.buildout-...
+    recipe = zc.buildout:debug
+    x = 1
+    <BLANKLINE>
+    [b]
+    __buildout_fingerprint__ = ...
+    __buildout_installed__ =
+    __buildout_signature__ = zc.buildout-...
+    recipe = zc.buildout:debug
+    x = 1
+
+    Changed parts are reinstalled and removed ones uninstalled, as usual:
+
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... parts = b
+    ... installed-database = .installed.db
+    ...
+    ... [a]
+    ... recipe = zc.buildout:debug
+    ... x = 1
+    ...
+    ... [b]
+    ... recipe = zc.buildout:debug
+    ... x = 2
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Uninstalling b.
+    Uninstalling a.
+    Installing b.
+      recipe='zc.buildout:debug'
+      x='2'
+
+    The sections of uninstalled parts are removed from the database:
+
+    >>> import zc.buildout.installed
+    >>> database = zc.buildout.installed.Database('.installed.db')
+    >>> sorted(database.read())
+    ['b', 'buildout']
+    >>> database.close()
+
+    The database is removed once nothing is installed anymore:
+
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... parts =
+    ... installed-database = .installed.db
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Uninstalling b.
+    >>> os.path.exists('.installed.db')
+    False
+
+    Like a missing installed file, an empty database means nothing is
+    installed:
+
+    >>> database.write({})
+    >>> database.close()
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... parts = a
+    ... installed-database = .installed.db
+    ...
+    ... [a]
+    ... recipe = zc.buildout:debug
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Installing a.
+      recipe='zc.buildout:debug'
+    >>> database = zc.buildout.installed.Database('.installed.db')
+    >>> sorted(database.read())
+    ['a', 'buildout']
+    >>> database.close()
+    """
+
+def installed_file_is_appended_to_and_compacted():
+    r"""
+    While parts are installed, changes are appended to the installed
+    file.  Once the buildout succeeds, the file is rewritten with just the
+    resulting state.
+
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... parts = a
+    ...
+    ... [a]
+    ... recipe = zc.buildout:debug
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Installing a.
+      recipe='zc.buildout:debug'
+
+    Let's interrupt the next buildout while it's installing a part:
+
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... parts = a b c
+    ...
+    ... [a]
+    ... recipe = zc.buildout:debug
+    ...
+    ... [b]
+    ... recipe = zc.buildout:debug
+    ...
+    ... [c]
+    ... recipe = zc.buildout:debug
+    ... ''')
+    >>> b = zc.buildout.buildout.Buildout(
+    ...     'buildout.cfg', [('buildout', 'log-level', 'WARNING')])
+    >>> install_part = b._install_part
+    >>> def install_part_but_c(part, installation):
+    ...     if part == 'c':
+    ...         raise ValueError('interrupted')
+    ...     install_part(part, installation)
+    >>> b._install_part = install_part_but_c
+    >>> b.install(())
+    Traceback (most recent call last):
+    ...
+    ValueError: interrupted
+
+    The changes were appended, including the installed part:
+
+    >>> cat('.installed.cfg') # doctest: +ELLIPSIS +NORMALIZE_WHITESPACE
+    [buildout]
+    installed_develop_eggs =
+    parts = a
+    <BLANKLINE>
+    [a]
+    __buildout_fingerprint__ = ...
+    __buildout_installed__ =
+    __buildout_signature__ = zc.buildout-...
+    recipe = zc.buildout:debug
+    <BLANKLINE>
+    [buildout]
+    installed_develop_eggs =
+    <BLANKLINE>
+    [buildout]
+    parts = a
+    <BLANKLINE>
+    [b]
+    __buildout_fingerprint__ = ...
+    __buildout_installed__ =
+    __buildout_signature__ = zc.buildout-...
+    recipe = zc.buildout:debug
+    <BLANKLINE>
+    [buildout]
+    parts = a b
+
+    The next buildout knows a and b are installed, and compacts the file
+    when it's done:
+
+    >>> print_(system(buildout), end='')
+    Updating a.
+      recipe='zc.buildout:debug'
+    Updating b.
+      recipe='zc.buildout:debug'
+    Installing c.
+      recipe='zc.buildout:debug'
+    >>> cat('.installed.cfg') # doctest: +ELLIPSIS +NORMALIZE_WHITESPACE
+    [buildout]
+    installed_develop_eggs =
+    parts = a b c
+    <BLANKLINE>
+    [a]
+    __buildout_fingerprint__ = ...
+    __buildout_installed__ =
+    __buildout_signature__ = zc.buildout-...
+    recipe = zc.buildout:debug
+    <BLANKLINE>
+    [b]
+    __buildout_fingerprint__ = ...
+    __buildout_installed__ =
+    __buildout_signature__ = zc.buildout-...
+    recipe = zc.buildout:debug
+    <BLANKLINE>
+    [c]
+    __buildout_fingerprint__ = ...
+    __buildout_installed__ =
+    __buildout_signature__ = zc.buildout-...
+    recipe = zc.buildout:debug
+    >>> ls('.')
+    -  .installed.cfg
+    d  bin
+    -  buildout.cfg
+    d  develop-eggs
+    d  eggs
+    d  parts
+
+    Changes are written once per step: after develop eggs are made, after
+    the parts that changed are uninstalled, and after each part is
+    installed, rather than whenever something changes.  Let's change all
+    of the parts, and see how often the installed file is synced:
+
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... parts = a b c
+    ...
+    ... [a]
+    ... recipe = zc.buildout:debug
+    ... x = 1
+    ...
+    ... [b]
+    ... recipe = zc.buildout:debug
+    ... x = 1
+    ...
+    ... [c]
+    ... recipe = zc.buildout:debug
+    ... x = 1
+    ... ''')
+    >>> b = zc.buildout.buildout.Buildout(
+    ...     'buildout.cfg', [('buildout', 'log-level', 'WARNING')])
+    >>> synced = []
+    >>> fsync = zc.buildout.buildout._fsync
+    >>> def fsync_(fileno):
+    ...     synced.append(fileno)
+    ...     fsync(fileno)
+    >>> zc.buildout.buildout._fsync = fsync_
+    >>> b.install(())
+      recipe='zc.buildout:debug'
+      x='1'
+      recipe='zc.buildout:debug'
+      x='1'
+      recipe='zc.buildout:debug'
+      x='1'
+    >>> zc.buildout.buildout._fsync = fsync
+
+    The develop step, the uninstallation of the 3 parts, the installation
+    of each part and the compaction each synced the file once:
+
+    >>> len(synced)
+    6
+    """
+
+def installed_files_can_be_checked_for_changes():
+    r"""
+    By default, parts whose options didn't change are reinstalled if some
+    of the files they installed are missing.  With the verify-installed
+    option set to stat, the size and modification time of the files is
+    recorded when parts are installed, so files that changed are
+    noticed too:
+
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... parts =
+    ... verify-installed = stat
+    ... ''')
+    >>> b = zc.buildout.buildout.Buildout('buildout.cfg', [])
+    >>> write('parts', 'a', 'a')
+    >>> mkdir('parts', 'd')
+    >>> files = ['parts/a', 'parts/d']
+    >>> manifest = b._installed_files_manifest(files)
+    >>> b._installed_files_unchanged('\n'.join(files), manifest)
+    True
+
+    Only the existence of directories is checked, as their content
+    often changes when what's installed is used:
+
+    >>> write('parts', 'd', 'log', '')
+    >>> b._installed_files_unchanged('\n'.join(files), manifest)
+    True
+
+    >>> os.utime(join('parts', 'a'), (0, 0))
+    >>> b._installed_files_unchanged('\n'.join(files), manifest)
+    False
+    >>> remove('parts', 'd')
+    >>> b._installed_files_unchanged('\n'.join(files), manifest)
+    False
+
+    With verify-installed set to content, a hash of the content of files
+    is recorded and compared instead of their modification time:
+
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... parts =
+    ... verify-installed = content
+    ... ''')
+    >>> b = zc.buildout.buildout.Buildout('buildout.cfg', [])
+    >>> files = ['parts/a']
+    >>> manifest = b._installed_files_manifest(files)
+    >>> os.utime(join('parts', 'a'), (1, 1))
+    >>> b._installed_files_unchanged('\n'.join(files), manifest)
+    True
+    >>> write('parts', 'a', 'b')
+    >>> b._installed_files_unchanged('\n'.join(files), manifest)
+    False
+
+    Many files are checked by several threads:
+
+    >>> files = ['parts/f%d' % i for i in range(500)]
+    >>> for f in files:
+    ...     write(f, f)
+    >>> manifest = b._installed_files_manifest(files)
+    >>> b._installed_files_unchanged('\n'.join(files), manifest)
+    True
+    >>> write('parts', 'f250', 'changed')
+    >>> b._installed_files_unchanged('\n'.join(files), manifest)
+    False
+
+    The recorded states are saved with the installed parts:
+
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... parts = a
+    ... verify-installed = stat
+    ...
+    ... [a]
+    ... recipe = zc.buildout:debug
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Installing a.
+      recipe='zc.buildout:debug'
+    >>> print_(system(buildout), end='')
+    Updating a.
+      recipe='zc.buildout:debug'
+    >>> cat('.installed.cfg') # doctest: +ELLIPSIS +NORMALIZE_WHITESPACE
+    [buildout]
+    installed_develop_eggs =
+    parts = a
+    <BLANKLINE>
+    [a]
+    __buildout_fingerprint__ = ...
+    __buildout_installed__ =
+    __buildout_manifest__ =
+    __buildout_signature__ = zc.buildout-...
+    recipe = zc.buildout:debug
+
+    >>> print_(system(buildout+' verify-installed=size'), end='')
+    While:
+      Initializing.
+    Error: Invalid value for 'verify-installed' option: 'size'
+    """
+
+def installed_parts_are_compared_by_fingerprint():
+    r"""
+    A fingerprint of the options of each installed part is saved with it,
+    to tell whether the part's configuration changed:
+
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... parts = a
+    ...
+    ... [a]
+    ... recipe = zc.buildout:debug
+    ... x = 1
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Installing a.
+      recipe='zc.buildout:debug'
+      x='1'
+    >>> import zc.buildout.configparser
+    >>> with open('.installed.cfg') as f:
+    ...     installed = zc.buildout.configparser.parse(f, 'f')['a']
+    >>> b = zc.buildout.buildout.Buildout('buildout.cfg', [])
+    >>> b._compute_part_signatures(['a'])
+    >>> (installed['__buildout_fingerprint__'] ==
+    ...  zc.buildout.buildout._options_fingerprint(b['a']))
+    True
+
+    >>> print_(system(buildout), end='')
+    Updating a.
+      recipe='zc.buildout:debug'
+      x='1'
+    >>> print_(system(buildout+' a:x=2'), end='')
+    Uninstalling a.
+    Installing a.
+      recipe='zc.buildout:debug'
+      x='2'
+
+    Parts installed without a fingerprint have their options compared:
+
+    >>> with open('.installed.cfg') as f:
+    ...     text = f.read()
+    >>> import re
+    >>> write('.installed.cfg',
+    ...       re.sub('__buildout_fingerprint__ = .*\n', '', text))
+    >>> print_(system(buildout+' a:x=2'), end='')
+    Updating a.
+      recipe='zc.buildout:debug'
+      x='2'
+    >>> write('.installed.cfg',
+    ...       re.sub('__buildout_fingerprint__ = .*\n', '', text))
+    >>> print_(system(buildout), end='')
+    Uninstalling a.
+    Installing a.
+      recipe='zc.buildout:debug'
+      x='1'
+    """
+
+def directories_can_be_uninstalled_in_the_background():
+    r"""
+    With the background-uninstall option, directories that are uninstalled
+    are moved to a trash directory and removed by background threads:
+
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... parts =
+    ... background-uninstall = true
+    ... ''')
+    >>> b = zc.buildout.buildout.Buildout('buildout.cfg', [])
+    >>> for name in 'a', 'b':
+    ...     mkdir('parts', name)
+    ...     mkdir('parts', name, 'data')
+    ...     write('parts', name, 'data', 'file', name)
+    >>> write('parts', 'c', 'c')
+    >>> b._uninstall('parts/a\nparts/b\nparts/c')
+    >>> ls('parts')
+    >>> b._trash.join()
+    >>> ls('.')
+    d  bin
+    -  buildout.cfg
+    d  develop-eggs
+    d  eggs
+    d  parts
+
+    What's left in the trash by an interrupted buildout is removed by the
+    next one:
+
+    >>> mkdir('.buildout-trash')
+    >>> mkdir('.buildout-trash', 'x')
+    >>> write('.buildout-trash', 'x', 'file', '')
+    >>> print_(system(buildout), end='')
+    >>> os.path.exists('.buildout-trash')
+    False
+
+    Directories that can't be moved to the trash are removed right away:
+
+    >>> b = zc.buildout.buildout.Buildout('buildout.cfg', [])
+    >>> mkdir('parts', 'a')
+    >>> def put(path):
+    ...     return False
+    >>> b._trash.put = put
+    >>> b._uninstall('parts/a')
+    >>> ls('parts')
+
+    When the installation fails after directories were put in the trash,
+    they're still removed before buildout exits, and no worker thread is
+    left waiting:
+
+    >>> import threading
+    >>> def workers():
+    ...     return [thread for thread in threading.enumerate()
+    ...             if thread.name == 'zc.buildout trash']
+    >>> b = zc.buildout.buildout.Buildout('buildout.cfg', [])
+    >>> mkdir('parts', 'a')
+    >>> def develop(reusable=None):
+    ...     b._uninstall('parts/a')
+    ...     raise ValueError('develop failed')
+    >>> b._develop = develop
+    >>> b.install(())
+    Traceback (most recent call last):
+    ...
+    ValueError: develop failed
+    >>> ls('parts')
+    >>> os.path.exists('.buildout-trash')
+    False
+    >>> workers()
+    []
+
+    Directories that can't be removed make the installation fail, once
+    the others are removed:
+
+    >>> b = zc.buildout.buildout.Buildout('buildout.cfg', [])
+    >>> mkdir('parts', 'a')
+    >>> mkdir('parts', 'b')
+    >>> def develop(reusable=None):
+    ...     b._uninstall('parts/a\nparts/b')
+    ...     return ''
+    >>> b._develop = develop
+    >>> rmtree = zc.buildout.buildout.rmtree
+    >>> def rmtree_(path):
+    ...     if os.listdir(path) == ['a']:
+    ...         raise OSError('Permission denied')
+    ...     rmtree(path)
+    >>> zc.buildout.buildout.rmtree = rmtree_
+    >>> b.install(()) # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    UserError: Couldn't remove the uninstalled directories:
+      /sample-buildout/.buildout-trash/...
+    They're left in /sample-buildout/.buildout-trash.
+    >>> zc.buildout.buildout.rmtree = rmtree
+    >>> ls('parts')
+    >>> workers()
+    []
+    """
+
+def develop_egg_hashes_can_be_cached():
+    r"""
+    With the develop-hash-cache option, the hashes of develop egg
+    directories are kept in a file, so the files in the directories don't
+    have to be read again as long as they don't change:
+
+    >>> mkdir('src')
+    >>> mkdir('src', 'sub')
+    >>> write('src', 'setup.py', 'setup')
+    >>> write('src', 'sub', 'data.txt', 'data')
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... parts =
+    ... develop-hash-cache = .develop-hashes
+    ... ''')
+    >>> import zc.buildout.buildout
+    >>> hashes = zc.buildout.buildout._dir_hashes
+    >>> src = os.path.join(sample_buildout, 'src')
+    >>> b = zc.buildout.buildout.Buildout('buildout.cfg', [])
+    >>> hashes.clear()
+    >>> dir_hash = b._develop_dir_hash(src)
+    >>> b._develop_hash_cache.save()
+    >>> os.path.exists('.develop-hashes')
+    True
+
+    The hashes are the same as without the cache:
+
+    >>> hashes.clear()
+    >>> zc.buildout.buildout._dir_hash(src) == dir_hash
+    True
+
+    A later buildout gets the hash from the cache, without opening any
+    files:
+
+    >>> opened = []
+    >>> def open_(*args):
+    ...     opened.append(os.path.basename(args[0]))
+    ...     return open(*args)
+    >>> zc.buildout.buildout.open = open_
+    >>> b = zc.buildout.buildout.Buildout('buildout.cfg', [])
+    >>> del opened[:]
+    >>> hashes.clear()
+    >>> b._develop_dir_hash(src) == dir_hash
+    True
+    >>> opened
+    []
+
+    The md5 hash of a directory can't be made of hashes of its files, so
+    when a file changes, the whole directory is read again:
+
+    >>> write('src', 'sub', 'data.txt', 'changed data')
+    >>> hashes.clear()
+    >>> b._develop_dir_hash(src) == dir_hash
+    False
+    >>> sorted(opened)
+    ['data.txt', 'setup.py']
+
+    With other algorithms (see the develop-hash-algorithm option), the
+    hashes of files are kept, so only the files that changed are read
+    again:
+
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... parts =
+    ... develop-hash-cache = .develop-hashes
+    ... develop-hash-algorithm = sha256
+    ... ''')
+    >>> b = zc.buildout.buildout.Buildout('buildout.cfg', [])
+    >>> hashes.clear()
+    >>> dir_hash = b._develop_dir_hash(src)
+    >>> b._develop_hash_cache.save()
+    >>> write('src', 'sub', 'data.txt', 'data')
+    >>> b = zc.buildout.buildout.Buildout('buildout.cfg', [])
+    >>> del opened[:]
+    >>> hashes.clear()
+    >>> b._develop_dir_hash(src) == dir_hash
+    False
+    >>> opened
+    ['data.txt']
+
+    The hash is still the same as without the cache:
+
+    >>> new_hash = b._develop_dir_hash(src)
+    >>> hashes.clear()
+    >>> zc.buildout.buildout._dir_hash(src, 'sha256') == new_hash
+    True
+    >>> del zc.buildout.buildout.open
+    """
+
+def develop_egg_hashes_can_use_other_algorithms():
+    r"""
+    With the develop-hash-algorithm option, develop egg directories are
+    hashed with another algorithm, hashing their files in threads:
+
+    >>> mkdir('src')
+    >>> for i in range(50):
+    ...     write('src', 'file%d.py' % i, 'data %d' % i)
+    >>> write('src', 'entry_points.txt', '''
+    ... [console_scripts]
+    ... a = a:main
+    ... b = b:main
+    ... ''')
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... parts =
+    ... develop-hash-algorithm = sha256
+    ... ''')
+    >>> import zc.buildout.buildout
+    >>> hashes = zc.buildout.buildout._dir_hashes
+    >>> src = os.path.join(sample_buildout, 'src')
+    >>> b = zc.buildout.buildout.Buildout('buildout.cfg', [])
+    >>> b._develop_hash_algorithm
+    'sha256'
+    >>> hashes.clear()
+    >>> dir_hash = zc.buildout.buildout._dir_hash(src, 'sha256', 4)
+    >>> print_(dir_hash) # doctest: +ELLIPSIS
+    sha256-...
+
+    The hash doesn't depend on the number of threads, or on the order of
+    entry points:
+
+    >>> write('src', 'entry_points.txt', '''
+    ... [console_scripts]
+    ... b = b:main
+    ... a = a:main
+    ... ''')
+    >>> hashes.clear()
+    >>> zc.buildout.buildout._dir_hash(src, 'sha256', 1) == dir_hash
+    True
+
+    but it does depend on the content of files, and on the groups of
+    entry points:
+
+    >>> write('src', 'entry_points.txt', '''
+    ... [console_scripts]
+    ... b = b:main
+    ... [gui_scripts]
+    ... a = a:main
+    ... ''')
+    >>> hashes.clear()
+    >>> zc.buildout.buildout._dir_hash(src, 'sha256', 4) == dir_hash
+    False
+    >>> write('src', 'file7.py', 'changed')
+    >>> hashes.clear()
+    >>> zc.buildout.buildout._dir_hash(src, 'sha256', 4) == dir_hash
+    False
+
+    With the default md5 algorithm, the files are hashed one after
+    another, as in earlier versions of buildout, but they're read ahead
+    by the threads, so the hash is the same with any number of them:
+
+    >>> hashes.clear()
+    >>> md5_hash = zc.buildout.buildout._dir_hash(src, 'md5', 1)
+    >>> hashes.clear()
+    >>> zc.buildout.buildout._dir_hash(src, 'md5', 4) == md5_hash
+    True
+    >>> read_ahead_size = zc.buildout.buildout._read_ahead_size
+    >>> zc.buildout.buildout._read_ahead_size = 20
+    >>> hashes.clear()
+    >>> zc.buildout.buildout._dir_hash(src, 'md5', 4) == md5_hash
+    True
+    >>> zc.buildout.buildout._read_ahead_size = read_ahead_size
+
+    If a file can't be read by a thread, the error is raised with the
+    name of the file:
+
+    >>> import errno
+    >>> def open_(path, *args):
+    ...     if os.path.basename(path) == 'file23.py':
+    ...         raise IOError(errno.EACCES, 'Permission denied')
+    ...     return open(path, *args)
+    >>> zc.buildout.buildout.open = open_
+    >>> hashes.clear()
+    >>> try:
+    ...     zc.buildout.buildout._dir_hash(src, 'sha256', 4)
+    ... except IOError as e:
+    ...     print_(e.strerror, os.path.basename(e.filename))
+    Permission denied file23.py
+    >>> hashes.clear()
+    >>> try:
+    ...     zc.buildout.buildout._dir_hash(src, 'md5', 4)
+    ... except IOError as e:
+    ...     print_(e.strerror, os.path.basename(e.filename))
+    Permission denied file23.py
+    >>> del zc.buildout.buildout.open
+
+    Algorithms must be known to hashlib:
+
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... parts =
+    ... develop-hash-algorithm = nohash
+    ... ''')
+    >>> print_(system(buildout), end='')
+    While:
+      Initializing.
+    Error: Invalid value for 'develop-hash-algorithm' option: 'nohash'
+    """
+
+def recipe_signatures_are_computed_once_per_recipe():
+    r"""
+    Parts using the same recipe get the same signature, which is only
+    computed once:
+
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... parts = a b c
+    ...
+    ... [a]
+    ... recipe = zc.buildout:debug
+    ... [b]
+    ... recipe = zc.buildout:debug
+    ... [c]
+    ... recipe = zc.buildout:debug
+    ... ''')
+    >>> b = zc.buildout.buildout.Buildout('buildout.cfg', [])
+    >>> for part in 'a', 'b', 'c':
+    ...     _ = b[part]
+    >>> resolved = []
+    >>> working_set = pkg_resources.working_set
+    >>> def resolve(requirements, *args, **kw):
+    ...     resolved.extend(requirements)
+    ...     return working_set.__class__.resolve(
+    ...         working_set, requirements, *args, **kw)
+    >>> working_set.resolve = resolve
+    >>> b._compute_part_signatures(['a', 'b', 'c'])
+    >>> del working_set.resolve
+    >>> resolved
+    [Requirement.parse('zc.buildout')]
+    >>> b['a']['__buildout_signature__'] == b['c']['__buildout_signature__']
+    True
+    >>> b['b']['__buildout_signature__'] == b['c']['__buildout_signature__']
+    True
+    """
+
+def unchanged_develop_eggs_can_be_reused():
+    r"""
+    With the reuse-develop-eggs option, setup.py develop isn't run again
+    for sources whose setup files and egg-info metadata didn't change:
+
+    >>> mkdir('foo')
+    >>> write('foo', 'setup.py',
+    ... '''
+    ... from setuptools import setup
+    ... setup(name="foo")
+    ... ''')
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... develop = foo
+    ... parts =
+    ... reuse-develop-eggs = true
+    ... ''')
+
+    >>> print_(system(join('bin', 'buildout')+' -vvv'), end='')
+    ... # doctest: +ELLIPSIS
+    Installing...
+    Develop: '/sample-buildout/foo'
+    in: '/sample-buildout/foo'
+    ... -q develop -mN -d /sample-buildout/develop-eggs/...
+
+    >>> output = system(join('bin', 'buildout')+' -vvv')
+    >>> 'Reusing' in output, '-q develop' in output
+    (True, False)
+    >>> ls('develop-eggs')
+    -  foo.egg-link
+    -  zc.recipe.egg.egg-link
+
+    When a setup file changes, the egg is developed again:
+
+    >>> write('foo', 'setup.cfg', '''
+    ... [metadata]
+    ... version = 2
+    ... ''')
+    >>> output = system(join('bin', 'buildout')+' -vvv')
+    >>> 'Reusing' in output, '-q develop' in output
+    (False, True)
+    >>> output = system(join('bin', 'buildout')+' -vvv')
+    >>> 'Reusing' in output, '-q develop' in output
+    (True, False)
+
+    A reused egg is still removed when it's no longer developed:
+
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... parts =
+    ... reuse-develop-eggs = true
+    ... ''')
+    >>> print_(system(join('bin', 'buildout')), end='')
+    >>> ls('develop-eggs')
+    -  zc.recipe.egg.egg-link
+    """
+
+def develop_eggs_are_made_concurrently_with_the_jobs_option():
+    r"""
+    With the jobs option, up to that many setup.py develop commands run
+    at the same time:
+
+    >>> for name in 'foo', 'bar', 'baz':
+    ...     mkdir(name)
+    ...     write(name, 'setup.py',
+    ...     '''
+    ... from setuptools import setup
+    ... setup(name=%r)
+    ... ''' % name)
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... develop = foo bar baz
+    ... parts =
+    ... jobs = 2
+    ... ''')
+    >>> output = system(join('bin', 'buildout'))
+    >>> for line in output.splitlines():
+    ...     if line.startswith('Develop'):
+    ...         print_(line)
+    Develop: '/sample-buildout/foo'
+    Develop: '/sample-buildout/bar'
+    Develop: '/sample-buildout/baz'
+    >>> ls('develop-eggs')
+    -  bar.egg-link
+    -  baz.egg-link
+    -  foo.egg-link
+    -  zc.recipe.egg.egg-link
+
+    The develop eggs are recorded in the order of the develop option:
+
+    >>> import zc.buildout.configparser
+    >>> with open('.installed.cfg') as f:
+    ...     installed = zc.buildout.configparser.parse(f, 'f')['buildout']
+    >>> print_(installed['installed_develop_eggs'])
+    /sample-buildout/develop-eggs/foo.egg-link
+    /sample-buildout/develop-eggs/bar.egg-link
+    /sample-buildout/develop-eggs/baz.egg-link
+
+    What's logged while developing a setup is logged in the order of the
+    develop option too, however long each one takes:
+
+    >>> import logging, time
+    >>> logger = logging.getLogger('zc.buildout')
+    >>> def develop(setup, dest):
+    ...     name = os.path.basename(setup)
+    ...     time.sleep(dict(foo=0.5, bar=0.2, baz=0).get(name))
+    ...     logger.info('Made %s.', name)
+    ...     return name
+    >>> old_develop = zc.buildout.easy_install.develop
+    >>> zc.buildout.easy_install.develop = develop
+    >>> b = zc.buildout.buildout.Buildout('buildout.cfg', [])
+    >>> b._develop_setups(['foo', 'bar', 'baz'], 'develop-eggs')
+    Develop: 'foo'
+    Made foo.
+    Develop: 'bar'
+    Made bar.
+    Develop: 'baz'
+    Made baz.
+    ['foo', 'bar', 'baz']
+    >>> zc.buildout.easy_install.develop = old_develop
+
+    If a setup script fails, the error is reported and the develop eggs
+    that were made are removed:
+
+    >>> write('bar', 'setup.py', 'raise ValueError("broken")')
+    >>> output = system(join('bin', 'buildout'))
+    >>> 'ValueError' in output
+    True
+    >>> ls('develop-eggs')
+    -  zc.recipe.egg.egg-link
+    """
+
+def eggs_directories_can_be_indexed():
+    r"""
+    With the eggs-directory-index option, the distributions in the eggs
+    directory are listed in an index, so the directory isn't scanned by
+    every installation:
+
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... parts =
+    ... eggs-directory-index = true
+    ... ''')
+    >>> b = zc.buildout.buildout.Buildout('buildout.cfg', [])
+    >>> zc.buildout.easy_install.eggs_directory_index()
+    True
+
+    >>> mkdir('index')
+    >>> mkdir('index', 'foo-1.0-py2.7.egg')
+    >>> mkdir('index', 'bar-1.0')
+    >>> mkdir('index', 'bar-1.0', 'bar-1.0.dist-info')
+    >>> scans = []
+    >>> scan = zc.buildout.easy_install._scan_eggs_directory
+    >>> def scan_(dest):
+    ...     scans.append(dest)
+    ...     return scan(dest)
+    >>> zc.buildout.easy_install._scan_eggs_directory = scan_
+    >>> directory = os.path.join(sample_buildout, 'index')
+    >>> index = zc.buildout.easy_install.EggsDirectoryIndex(directory)
+    >>> for path in sorted(index.paths()):
+    ...     print_(path)
+    /sample-buildout/index/bar-1.0
+    /sample-buildout/index/foo-1.0-py2.7.egg
+    >>> len(scans)
+    1
+    >>> ls('index')
+    d  .buildout-index
+    d  bar-1.0
+    d  foo-1.0-py2.7.egg
+
+    The index is kept between runs:
+
+    >>> index = zc.buildout.easy_install.EggsDirectoryIndex(directory)
+    >>> len(index.paths()), len(scans)
+    (2, 1)
+
+    Distributions added by buildout are added to the index:
+
+    >>> mkdir('index', 'baz-1.0-py2.7.egg')
+    >>> index.add(os.path.join(directory, 'baz-1.0-py2.7.egg'))
+    >>> len(index.paths()), len(scans)
+    (3, 1)
+
+    When the directory is changed otherwise, it's scanned again:
+
+    >>> remove('index', 'foo-1.0-py2.7.egg')
+    >>> index = zc.buildout.easy_install.EggsDirectoryIndex(directory)
+    >>> len(index.paths()), len(scans)
+    (2, 2)
+    >>> mkdir('index', 'foo-2.0-py2.7.egg')
+    >>> mkdir('index', 'spam-2.0-py2.7.egg')
+    >>> index.add(os.path.join(directory, 'spam-2.0-py2.7.egg'))
+    >>> len(index.paths()), len(scans)
+    (4, 3)
+
+    >>> zc.buildout.easy_install._scan_eggs_directory = scan
+    >>> _ = zc.buildout.easy_install.eggs_directory_index(False)
+    """
+
+def eggs_are_only_read_when_their_projects_are_looked_up():
+    r"""
+    Eggs' file names start with their project names, so the installer
+    only reads the eggs of the projects it looks up:
+
+    >>> mkdir('lazy')
+    >>> def make_egg(name, version):
+    ...     egg = '%s-%s-py%d.%d.egg' % ((name, version) + sys.version_info[:2])
+    ...     mkdir('lazy', egg)
+    ...     mkdir('lazy', egg, 'EGG-INFO')
+    ...     write('lazy', egg, 'EGG-INFO', 'PKG-INFO',
+    ...           'Metadata-Version: 1.0\nName: %s\nVersion: %s\n'
+    ...           % (name, version))
+    >>> make_egg('foo', '1.0')
+    >>> make_egg('foo', '2.0')
+    >>> make_egg('bar', '1.0')
+    >>> mkdir('lazy', 'spam-1.0')
+    >>> mkdir('lazy', 'spam-1.0', 'spam-1.0.dist-info')
+    >>> write('lazy', 'spam-1.0', 'spam-1.0.dist-info', 'METADATA',
+    ...       'Metadata-Version: 1.2\nName: spam\nVersion: 1.0\n')
+
+    >>> dest = os.path.join(sample_buildout, 'lazy')
+    >>> mkdir('empty')
+    >>> empty = os.path.join(sample_buildout, 'empty')
+
+    >>> read = []
+    >>> find_distributions = pkg_resources.find_distributions
+    >>> def find_distributions_(location, *args, **kw):
+    ...     if os.path.dirname(location) == dest:
+    ...         read.append(os.path.basename(location))
+    ...     return find_distributions(location, *args, **kw)
+    >>> pkg_resources.find_distributions = find_distributions_
+
+    >>> ws = zc.buildout.easy_install.install(
+    ...     ['foo'], dest, links=(), path=[empty], newest=False)
+    >>> [(dist.project_name, dist.version) for dist in ws]
+    [('foo', '2.0')]
+
+    Only the eggs of foo were read, and the distribution that isn't an
+    egg, whose project can't be told from its name:
+
+    >>> for name in sorted(set(read)):
+    ...     print_(name.split('-py')[0])
+    foo-1.0
+    foo-2.0
+    spam-1.0
+
+    Distributions in the eggs directory are still found like before:
+
+    >>> del read[:]
+    >>> ws = zc.buildout.easy_install.install(
+    ...     ['bar', 'spam'], dest, links=(), path=[empty], newest=False)
+    >>> sorted((dist.project_name, dist.version) for dist in ws)
+    [('bar', '1.0'), ('spam', '1.0')]
+    >>> for name in sorted(set(read)):
+    ...     print_(name.split('-py')[0])
+    bar-1.0
+    spam-1.0
+
+    >>> pkg_resources.find_distributions = find_distributions
+    """
+
+def installer_constrains_and_resolves_each_requirement():
+    r"""
+    While resolving requirements, the installer constrains each distinct
+    requirement with the [versions] pins once, and looks up the
+    requirements of a distribution once per set of extras.  Requirements
+    with other extras or version specifications are still resolved on
+    their own:
+
+    >>> mkdir('resolve')
+    >>> def make_egg(name, version, requires=''):
+    ...     egg = '%s-%s-py%d.%d.egg' % ((name, version) + sys.version_info[:2])
+    ...     mkdir('resolve', egg)
+    ...     mkdir('resolve', egg, 'EGG-INFO')
+    ...     write('resolve', egg, 'EGG-INFO', 'PKG-INFO',
+    ...           'Metadata-Version: 1.0\nName: %s\nVersion: %s\n'
+    ...           % (name, version))
+    ...     write('resolve', egg, 'EGG-INFO', 'requires.txt', requires)
+    >>> make_egg('app', '1.0', 'lib\n[extra]\nhelper\n')
+    >>> make_egg('other', '1.0', 'lib<2\n')
+    >>> make_egg('lib', '1.0')
+    >>> make_egg('lib', '2.0')
+    >>> make_egg('helper', '1.0')
+
+    >>> dest = os.path.join(sample_buildout, 'resolve')
+    >>> mkdir('empty')
+    >>> empty = os.path.join(sample_buildout, 'empty')
+    >>> def install(specs, versions=None):
+    ...     try:
+    ...         ws = zc.buildout.easy_install.install(
+    ...             specs, dest, links=(), path=[empty], newest=False,
+    ...             versions=versions)
+    ...     except zc.buildout.UserError as e:
+    ...         print_(e.__class__.__name__ + ':', e)
+    ...         return
+    ...     for dist in sorted(ws, key=lambda dist: dist.project_name):
+    ...         print_(dist.project_name, dist.version)
+
+    Extras give other requirements, even for a distribution whose
+    requirements were looked up without them:
+
+    >>> install(['app'])
+    app 1.0
+    lib 2.0
+    >>> install(['app', 'app[extra]'])
+    app 1.0
+    helper 1.0
+    lib 2.0
+
+    A requirement with another version specification is checked against
+    the distribution picked already:
+
+    >>> install(['lib', 'other'])
+    VersionConflict: There is a version conflict.
+    We already have: lib 2.0
+    but other 1.0 requires 'lib<2'.
+
+    Each installation constrains requirements with its own pins, so a
+    pin that changed is used:
+
+    >>> install(['app', 'other'], versions=dict(lib='1.0'))
+    app 1.0
+    lib 1.0
+    other 1.0
+    >>> install(['app'], versions=dict(lib='2.0'))
+    app 1.0
+    lib 2.0
+    >>> install(['other'], versions=dict(lib='2.0'))
+    IncompatibleConstraintError: The requirement ('lib<2') is not allowed by your [versions] constraint (2.0)
+    """
+
+def history_of_values_is_only_recorded_to_annotate_them():
+    """
+    >>> write('base.cfg', '''
+    ... [buildout]
+    ... parts =
+    ... x = 1
+    ... ''')
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... extends = base.cfg
+    ... x += 2
+    ... ''')
+
+    >>> buildout = zc.buildout.buildout.Buildout(
+    ...     'buildout.cfg', [], command='install')
+    >>> buildout._annotated['buildout']['x']
+    <SectionKey value=1 2 /sample-buildout/buildout.cfg>
+    >>> print_(buildout._annotated['buildout']['x'].history)
+    None
+
+    >>> buildout = zc.buildout.buildout.Buildout(
+    ...     'buildout.cfg', [], command='annotate')
+    >>> for item in buildout._annotated['buildout']['x'].history:
+    ...     print_(item)
+    <HistoryItem operation=SET value=1 /sample-buildout/base.cfg>
+    <HistoryItem operation=ADD value=2 /sample-buildout/buildout.cfg>
+
+    Values created outside of a buildout still record their history:
+
+    >>> zc.buildout.buildout.SectionKey('1', 'test').history
+    [<HistoryItem operation=SET value=1 source=test>]
+    """
+
 if sys.platform == 'win32':
     del buildout_honors_umask # umask on dohs is academic
 
@@ -3814,6 +5526,7 @@ def test_suite():
                 ]),
             ),
         zc.buildout.rmtree.test_suite(),
+        zc.buildout.replace.test_suite(),
         doctest.DocFileSuite(
             'windows.txt',
             setUp=zc.buildout.testing.buildoutSetUp,
@@ -17,6 +17,7 @@ import logging
 import os
 import sys
 
+import zc.buildout.context
 import zc.buildout.easy_install
 
 logger = logging.getLogger(__name__)
@@ -24,6 +25,10 @@ logger = logging.getLogger(__name__)
 
 class Base:
 
+    # Commands are run in the context of the part, rather than in the
+    # working directory, so parts can be installed at the same time.
+    uses_context = True
+
     def __init__(self, buildout, name, options):
         self.name, self.options = name, options
 
@@ -83,7 +88,7 @@ class Custom(Base):
 
         distribution = options.get('egg', options.get('eggs', self.name)
                                    ).strip()
-        self._set_environment()
+        context = zc.buildout.context.activate(self._context())
         try:
             return zc.buildout.easy_install.build(
                 distribution, options['_d'], self.build_ext,
@@ -91,28 +96,23 @@ class Custom(Base):
                 [options['_e']], newest=self.newest,
                 )
         finally:
-            self._restore_environment()
-
-
-    def _set_environment(self):
-        self._saved_environment = {}
-        for key, value in list(self.environment.items()):
-            if key in os.environ:
-                self._saved_environment[key] = os.environ[key]
-            # Interpolate value with variables from environment. Maybe there
-            # should be a general way of doing this in buildout with something
-            # like ${environ:foo}:
-            os.environ[key] = value % os.environ
-
-    def _restore_environment(self):
-        for key in self.environment:
-            if key in self._saved_environment:
-                os.environ[key] = self._saved_environment[key]
-            else:
-                try:
-                    del os.environ[key]
-                except KeyError:
-                    pass
+            zc.buildout.context.activate(context)
+
+    def _context(self):
+        # Rather than changing os.environ, which other recipes running
+        # at the same time would see, build with a context that has the
+        # additional environment variables.
+        context = getattr(self.options, 'context', None)
+        if context is None:
+            context = zc.buildout.context.Context(os.getcwd())
+        environ = context.environ()
+        # Interpolate value with variables from environment. Maybe there
+        # should be a general way of doing this in buildout with something
+        # like ${environ:foo}:
+        return context.extend(dict(
+            (key, value % environ)
+            for key, value in self.environment.items()
+            ))
 
 
 class Develop(Base):
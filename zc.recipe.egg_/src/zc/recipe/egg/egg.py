@@ -16,12 +16,16 @@
 
 import copy
 import glob
+import hashlib
+import json
 import logging
 import os
 import pkg_resources
 import re
 import sys
+import threading
 import zc.buildout.easy_install
+import zc.buildout.replace
 
 from zc.buildout.buildout import bool_option
 
@@ -29,6 +33,7 @@ from zc.buildout.buildout import bool_option
 class Eggs(object):
 
     _WORKING_SET_CACHE_ATTR_NAME = '_zc_recipe_egg_working_set_cache'
+    _WORKING_SET_FILE_ATTR_NAME = '_zc_recipe_egg_working_set_file'
 
     def __init__(self, buildout, name, options):
         self.buildout = buildout
@@ -58,6 +63,12 @@ class Eggs(object):
         options['develop-eggs-directory'] = b_options['develop-eggs-directory']
         options['_d'] = options['develop-eggs-directory']  # backward compat.
 
+        working_set_cache = b_options.get('working-set-cache')
+        if working_set_cache:
+            working_set_cache = os.path.join(
+                b_options['directory'], working_set_cache)
+        self.working_set_cache = working_set_cache
+
     def working_set(self, extra=()):
         """Separate method to just get the working set
 
@@ -151,6 +162,13 @@ class Eggs(object):
             tuple(allow_hosts),
             allow_unknown_extras,
         )
+        if cache_key not in cache_storage:
+            working_set_file = self._get_working_set_file()
+            if working_set_file is not None:
+                ws = working_set_file.get(
+                    cache_key, eggs_dir, develop_eggs_dir)
+                if ws is not None:
+                    cache_storage[cache_key] = ws
         if cache_key not in cache_storage:
             if offline:
                 ws = zc.buildout.easy_install.working_set(
@@ -168,6 +186,8 @@ class Eggs(object):
                     allow_unknown_extras=allow_unknown_extras)
             ws = self._sort_working_set(ws)
             cache_storage[cache_key] = ws
+            if working_set_file is not None:
+                working_set_file.set(cache_key, eggs_dir, develop_eggs_dir, ws)
 
         # `pkg_resources.WorkingSet` instances are mutable, so we need to return
         # a copy.
@@ -192,6 +212,135 @@ class Eggs(object):
         return cache_storage
 
 
+    def _get_working_set_file(self):
+        """Return the WorkingSetFile of the working-set-cache option
+
+        None is returned if the option isn't used.  Like the cache
+        storage, it's stored in an attribute of `self.buildout`, so it's
+        shared by the parts.
+        """
+        if not self.working_set_cache:
+            return None
+        working_set_file = getattr(
+            self.buildout, self._WORKING_SET_FILE_ATTR_NAME, None)
+        if (working_set_file is None or
+            working_set_file.path != self.working_set_cache):
+            working_set_file = WorkingSetFile(self.working_set_cache)
+            setattr(
+                self.buildout,
+                self._WORKING_SET_FILE_ATTR_NAME,
+                working_set_file)
+        return working_set_file
+
+
+class WorkingSetFile(object):
+    """Working sets kept in a file between buildout runs
+
+    For each request, the distributions of its working set are recorded,
+    with a hash of what the working set depends on: the request, the
+    [versions] pins, the Python version, and the contents of the eggs and
+    develop-eggs directories.  As long as the hash is the same, the
+    working set is made of the same distributions, without resolving the
+    requirements again.
+
+    Only working sets of develop eggs and distributions pinned to exact
+    versions are recorded.  Otherwise, a new run could pick other
+    versions, for example because newer ones have been released.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self.working_sets = json.load(f)
+        except (IOError, OSError, ValueError):
+            self.working_sets = {}
+
+    def get(self, request, eggs_dir, develop_eggs_dir):
+        """Return the recorded working set for a request, or None
+        """
+        recorded = self.working_sets.get(_hash(request))
+        if recorded is None:
+            return None
+        state, dists = recorded
+        if state != _state(request, eggs_dir, develop_eggs_dir):
+            return None
+        # Only the recorded distributions are used, even if there are
+        # others in their locations, such as site-packages.
+        found = {}
+        ws = pkg_resources.WorkingSet([])
+        for location, project_name, version in dists:
+            if location not in found:
+                found[location] = dict(
+                    ((dist.key, dist.version), dist)
+                    for dist in pkg_resources.find_distributions(location))
+            dist = found[location].get((project_name.lower(), version))
+            if dist is None:
+                return None
+            ws.add(dist)
+        return ws
+
+    def set(self, request, eggs_dir, develop_eggs_dir, ws):
+        """Record the working set for a request, if it's pinned
+        """
+        versions = zc.buildout.easy_install.default_versions()
+        for dist in ws:
+            if dist.precedence == pkg_resources.DEVELOP_DIST:
+                continue
+            version = versions.get(dist.project_name.lower())
+            if not version or version.lstrip('=') != dist.version:
+                return
+        recorded = [
+            _state(request, eggs_dir, develop_eggs_dir),
+            [[dist.location, dist.project_name, dist.version]
+             for dist in ws],
+            ]
+        key = _hash(request)
+        with self._lock:
+            if self.working_sets.get(key) == recorded:
+                return
+            self.working_sets[key] = recorded
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.working_sets, f, sort_keys=True)
+            zc.buildout.replace.replace(tmp, self.path)
+
+
+def _hash(data):
+    return hashlib.md5(repr(data).encode('utf-8')).hexdigest()
+
+def _state(request, eggs_dir, develop_eggs_dir):
+    # Hash everything but the request a working set depends on.
+    state = [
+        sys.version,
+        sys.executable,
+        sorted(zc.buildout.easy_install.default_versions().items()),
+        ]
+    for directory in eggs_dir, develop_eggs_dir:
+        try:
+            state.append(sorted(os.listdir(directory)))
+        except OSError:
+            state.append(None)
+    # Develop eggs are made again by every run, so their metadata,
+    # rather than the files' modification times, is checked.
+    for egg_link in sorted(glob.glob(
+            os.path.join(develop_eggs_dir, '*.egg-link'))):
+        try:
+            with open(egg_link) as f:
+                location = f.readline().strip()
+            for egg_info in sorted(glob.glob(
+                    os.path.join(location, '*.egg-info'))):
+                for name in sorted(os.listdir(egg_info)):
+                    if name == 'SOURCES.txt':
+                        continue
+                    with open(os.path.join(egg_info, name), 'rb') as f:
+                        state.append((egg_info, name, _hash(f.read())))
+        except (IOError, OSError):
+            state.append((egg_link, None))
+    return _hash(state)
+
+
 class Scripts(Eggs):
 
     def __init__(self, buildout, name, options):